@@ -1,19 +1,45 @@
 import os
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
-import tensorflow as tf
 import numpy as np
 from flask_cors import CORS
-from preprocess import preprocess_image
-from flask import Flask, request, jsonify
-from pad_signature import add_signature_above_name
-from similarities import calculate_similarity
-from augmented import create_augmented_signature
+from preprocess import IMAGE_SIZE, preprocess_parallel
+from flask import Flask, Response, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
+from pad_signature import add_signature_above_name, sign_document
+from similarities import average_pair_similarity, reference_similarities
+from embedding_store import EmbeddingStore, StaleEnrollmentError, is_stale
+from cache import ContentCache
+from stamp_cache import StampCache
+from jobs import JobQueue
+from uploads import MAX_REQUEST_BYTES, UploadError, read_uploads, upload_metrics
+import model_registry
+import tracing
+from tracing import stage
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__)) 
 LARAVEL_BASE_DIR = os.path.join(BASE_DIR, '..')
 LARAVEL_STORAGE_DIR = os.path.join(LARAVEL_BASE_DIR, "storage/app/private")
 
+
+class StoragePathError(ValueError):
+    pass
+
+
+def _storage_path(relative):
+    # Laravel sends '/storage/...' URLs or paths relative to its private disk.
+    # Every file the signing endpoints touch goes through here, so they all
+    # reject the same paths: anything that escapes the disk with '..' or an
+    # absolute component.
+    root = os.path.normpath(LARAVEL_STORAGE_DIR)
+    path = os.path.normpath(os.path.join(root, str(relative).replace('/storage', '').lstrip('/')))
+    if os.path.commonpath([root, path]) != root:
+        raise StoragePathError(f"Path is outside the storage directory: {relative}")
+    return path
+
 app = Flask(__name__)
+# Werkzeug stops reading the body once this is exceeded, before any parsing.
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+tracing.install(app)
 CORS(app, 
      resources={
          r"/api/*": {
@@ -26,9 +52,111 @@ CORS(app,
          }
      })
 
+embedding_store = EmbeddingStore(
+    os.environ.get('SIGNATURE_EMBEDDINGS_DIR', os.path.join(LARAVEL_STORAGE_DIR, 'signature_embeddings')),
+    int(os.environ.get('SIGNATURE_EMBEDDING_CACHE_USERS', 128))
+)
+signature_cache = ContentCache(
+    int(os.environ.get('SIGNATURE_CACHE_MAX_BYTES', 256 * 1024 * 1024)),
+    os.environ.get('SIGNATURE_CACHE_DIR') or None
+)
+stamp_cache = StampCache(
+    int(os.environ.get('SIGNATURE_STAMP_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+    int(os.environ.get('SIGNATURE_STAMP_VARIANTS', 5))
+)
+
+def _run_signing_job(payload):
+    placements = payload['placements']
+    for placement in placements:
+        placement['signature'] = stamp_cache.get_stamp(placement.pop('signature_paths'), placement['ink_color'])
+
+    results = sign_document(payload['pdf_file'], placements)
+    return [
+        {"signatory": placement['name'], "placed": placed}
+        for placement, placed in zip(placements, results)
+    ]
+
+job_queue = JobQueue(
+    os.environ.get('SIGNATURE_JOBS_DB', os.path.join(BASE_DIR, 'instance', 'jobs.sqlite3')),
+    {'sign': _run_signing_job},
+    workers=int(os.environ.get('SIGNATURE_JOB_WORKERS', 2))
+)
+
+def _enqueue_signing(pdf_file, placements):
+    job_id = job_queue.enqueue('sign', {'pdf_file': pdf_file, 'placements': placements}, document=os.path.realpath(pdf_file))
+    return jsonify({"jobId": job_id, "status": "queued"}), 202
+
+# Load the model off the request thread so the app (and /api/sign, which never
+# touches TensorFlow) is serving immediately; validation waits on the same load.
+if os.environ.get('SIGNATURE_PRELOAD_MODEL', '1') != '0':
+    model_registry.preload_async()
+
 @app.route('/api/status', methods=['GET'])
 def status():
-    return jsonify({"status": "ok", "message": "App status: Successful", "base_dir":LARAVEL_BASE_DIR }), 200
+    return jsonify({
+        "status": "ok",
+        "message": "App status: Successful",
+        "base_dir": LARAVEL_BASE_DIR,
+        "model": model_registry.model_status(),
+        "batcher": model_registry.batcher_metrics(),
+        "cache": signature_cache.stats(),
+        "stamps": stamp_cache.stats(),
+        "jobs": job_queue.stats(),
+        "uploads": upload_metrics.stats()
+    }), 200
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    # Per process: under gunicorn each worker reports its own counters.
+    model = model_registry.model_status()
+    batcher = model_registry.batcher_metrics()
+    cache = signature_cache.stats()
+    stamps = stamp_cache.stats()
+    uploads = upload_metrics.stats()
+    jobs = job_queue.stats()
+
+    body = tracing.render_metrics([
+        ("signature_model_ready", "gauge", "1 when the feature extractor is loaded.", int(model["ready"])),
+        ("signature_model_load_seconds", "gauge", "Time the last model load took.", model["loadTime"]),
+        ("signature_batcher_queue_depth", "gauge", "Requests waiting for the inference batcher.", batcher.get("queueDepth")),
+        ("signature_cache_bytes", "gauge", "Bytes held by the feature/image cache.", cache["bytes"]),
+        ("signature_cache_hit_ratio", "gauge", "Feature/image cache hit ratio.", cache["hitRate"]),
+        ("signature_stamp_cache_hit_ratio", "gauge", "Signature stamp cache hit ratio.", stamps["hitRate"]),
+        ("signature_upload_bytes_total", "counter", "Signature upload bytes read by this process.", uploads["bytes"]),
+        ("signature_upload_requests_total", "counter", "Requests whose uploads were read by this process.", uploads["requests"]),
+        ("signature_upload_rejected_total", "counter", "Rejected uploads by error code.", [
+            ((("code", code),), count) for code, count in uploads["rejected"].items()
+        ]),
+        ("signature_jobs", "gauge", "Signing jobs in the queue database by status.", [
+            ((("status", status),), count) for status, count in jobs.items() if status != "workers"
+        ]),
+    ])
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(error):
+    upload_metrics.reject("request_too_large")
+    return jsonify({
+        "errorCode": "request_too_large",
+        "error": f"The upload exceeds the {MAX_REQUEST_BYTES // (1024 * 1024)} MB request limit."
+    }), 413
+
+@app.errorhandler(StoragePathError)
+def invalid_storage_path(error):
+    return jsonify({"errorCode": "invalid_path", "error": str(error)}), 400
+
+@app.before_request
+def start_job_workers():
+    # Queued jobs left over from a previous run are picked up as soon as the
+    # process serves its first request.
+    job_queue.ensure_workers()
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found."}), 404
+    return jsonify(job), 200
 
 @app.route('/api/sign', methods=['POST'])
 def sign():
@@ -37,7 +165,7 @@ def sign():
     if not data or 'pdf' not in data or 'signatory' not in data or 'signatures' not in data:
         return jsonify({"error": "PDF file path, signatory, and signature images are required."}), 400
 
-    pdf_file = os.path.join(LARAVEL_STORAGE_DIR, data['pdf'].replace('/storage', '').lstrip('/'))
+    pdf_file = _storage_path(data['pdf'])
 
     signatory = data['signatory'] 
     representative_name = data.get('representative_name')
@@ -49,15 +177,23 @@ def sign():
     signature_paths = data['signatures']
     
     signature_full_paths = [
-        os.path.join(LARAVEL_STORAGE_DIR, sig_path.replace('/storage', '').lstrip('/'))
+        _storage_path(sig_path)
         for sig_path in signature_paths
     ]
 
     if not os.path.exists(pdf_file):
         return jsonify({"error": f"Document file not found: {os.path.basename(pdf_file)}"}), 400
 
+    if data.get('async'):
+        return _enqueue_signing(pdf_file, [{
+            'name': signatory,
+            'signature_paths': signature_full_paths,
+            'representative_name': representative_name,
+            'ink_color': ink_color,
+        }])
+
     try:
-        augmented_signature = create_augmented_signature(signature_full_paths)
+        augmented_signature = stamp_cache.get_stamp(signature_full_paths, ink_color)
 
         add_signature_above_name(
             pdf_file, 
@@ -75,6 +211,79 @@ def sign():
         print(f"Error adding signature: {e}")
         return jsonify({"error": f"Failed to add signature: {str(e)}"}), 500
 
+@app.route('/api/sign/warm', methods=['POST'])
+def warm_stamps():
+    data = request.get_json()
+
+    if not data or not data.get('signatures'):
+        return jsonify({"error": "Signature images are required."}), 400
+
+    ink_colors = [color for color in data.get('ink_colors', ['black', 'blue']) if color in ['black', 'blue']] or ['black']
+
+    signature_full_paths = [
+        _storage_path(sig_path)
+        for sig_path in data['signatures']
+    ]
+
+    missing = [os.path.basename(path) for path in signature_full_paths if not os.path.exists(path)]
+    if missing:
+        return jsonify({"error": f"Signature file not found: {', '.join(missing)}"}), 400
+
+    try:
+        pools = stamp_cache.warm(signature_full_paths, ink_colors)
+        return jsonify({"message": "Signature stamps rendered.", "variants": pools}), 200
+
+    except Exception as e:
+        print(f"Error rendering signature stamps: {e}")
+        return jsonify({"error": f"Failed to render signature stamps: {str(e)}"}), 500
+
+@app.route('/api/sign/batch', methods=['POST'])
+def sign_batch():
+    data = request.get_json()
+
+    if not data or 'pdf' not in data or not isinstance(data.get('signatories'), list) or not data['signatories']:
+        return jsonify({"error": "PDF file path and a list of signatories are required."}), 400
+
+    pdf_file = _storage_path(data['pdf'])
+
+    if not os.path.exists(pdf_file):
+        return jsonify({"error": f"Document file not found: {os.path.basename(pdf_file)}"}), 400
+
+    placements = []
+    for entry in data['signatories']:
+        if not isinstance(entry, dict) or 'signatory' not in entry or not entry.get('signatures'):
+            return jsonify({"error": "Each signatory needs a name and signature images."}), 400
+
+        ink_color = entry.get('ink_color', 'black')
+        if ink_color not in ['black', 'blue']:
+            ink_color = 'black'
+
+        placements.append({
+            'name': entry['signatory'],
+            'signature_paths': [
+                _storage_path(sig_path)
+                for sig_path in entry['signatures']
+            ],
+            'representative_name': entry.get('representative_name'),
+            'ink_color': ink_color,
+        })
+
+    if data.get('async'):
+        return _enqueue_signing(pdf_file, placements)
+
+    try:
+        results = _run_signing_job({'pdf_file': pdf_file, 'placements': placements})
+        placed = sum(result['placed'] for result in results)
+
+        return jsonify({
+            "message": f"Signed {placed} of {len(results)} signatories.",
+            "results": results
+        }), 200
+
+    except Exception as e:
+        print(f"Error adding signatures: {e}")
+        return jsonify({"error": f"Failed to add signatures: {str(e)}"}), 500
+
 # @app.route('/api/sign', methods=['POST'])
 # def sign():
 #     data = request.get_json()
@@ -132,76 +341,23 @@ def validate_signatures():
                 "error": "Please upload at least 3 signature samples for validation."
             })
 
-        for file in files:
-            if not file.filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+        try:
+            features, error = _signature_features(files)
+            if error:
                 return jsonify({
                     "isMatch": False,
                     "averageSimilarity": 0,
                     "confidence": "Low",
-                    "errorCode": "invalid_file_type",
-                    "error": "Please ensure all uploaded files are valid signature images (PNG, JPG, JPEG)."
+                    "errorCode": error[0],
+                    "error": error[1]
                 })
 
-        try:
-            model = tf.keras.models.load_model('model.keras')
-            processed_images = []
-            
-            for file in files:
-                try:
-                    processed = preprocess_image(file)
-                    processed_images.append(processed)
-                except Exception as img_err:
-                    if "has transparency" in str(img_err).lower():
-                        return jsonify({
-                            "isMatch": False,
-                            "averageSimilarity": 0,
-                            "confidence": "Low",
-                            "errorCode": "transparency_detected",
-                            "error": "Please upload signatures without transparency (solid background only)."
-                        })
-                    else:
-                        return jsonify({
-                            "isMatch": False,
-                            "averageSimilarity": 0,
-                            "confidence": "Low",
-                            "errorCode": "preprocessing_error",
-                            "error": "Please ensure your signature images are clear and properly formatted."
-                        })
-            
-            intermediate_model = tf.keras.models.Model(
-                inputs=model.inputs,
-                outputs=[
-                    model.get_layer("conv2d_2").output,  
-                    model.get_layer("dense_1").output 
-                ]
-            )
+            conv_features, dense_features = features
+
+            with stage('similarity'):
+                raw_similarity = average_pair_similarity(conv_features, dense_features)
 
-            feature_vectors = []
-            for image in processed_images:
-                try:
-                    conv_output, dense_output = intermediate_model.predict(image)
-                    conv_flattened = conv_output.flatten()
-                    dense_flattened = dense_output.flatten()
-                    feature_vectors.append((conv_flattened, dense_flattened))
-                except tf.errors.InvalidArgumentError as shape_err:
-                    return jsonify({
-                        "isMatch": False,
-                        "averageSimilarity": 0,
-                        "confidence": "Low",
-                        "errorCode": "image_format_error",
-                        "error": "Please upload clearer signature images without transparency or special formats."
-                    })
-
-            similarities = []
-            for i in range(len(feature_vectors)):
-                for j in range(i + 1, len(feature_vectors)):
-                    conv1, dense1 = feature_vectors[i]
-                    conv2, dense2 = feature_vectors[j]
-                    
-                    similarity = float(calculate_similarity(conv1, conv2) + calculate_similarity(dense1, dense2))
-                    similarities.append(similarity)
-
-            if not similarities:
+            if raw_similarity is None:
                 return jsonify({
                     "isMatch": False,
                     "averageSimilarity": 0,
@@ -210,13 +366,13 @@ def validate_signatures():
                     "error": "Could not compare signatures. Please upload clearer images."
                 })
 
-            average_similarity = float(np.mean(similarities)) * 50
+            average_similarity = raw_similarity * 50
             
             if average_similarity < 60:
                 return jsonify({
                     "isMatch": False,
                     "averageSimilarity": round(average_similarity, 2),
-                    "rawSimilarity": round(float(np.mean(similarities)), 4),
+                    "rawSimilarity": round(raw_similarity, 4),
                     "confidence": "Low",
                     "errorCode": "inconsistent_signatures",
                     "error": "The signatures appear too different from each other. Please upload more consistent signature samples."
@@ -228,13 +384,13 @@ def validate_signatures():
             return jsonify({
                 "isMatch": is_match,
                 "averageSimilarity": round(average_similarity, 2),
-                "rawSimilarity": round(float(np.mean(similarities)), 4),
+                "rawSimilarity": round(raw_similarity, 4),
                 "confidence": confidence.lower()
             })
             
-        except tf.errors.OpError as tf_err:
+        except Exception as tf_err:
             # Handle specific TensorFlow errors
-            if "incompatible with the layer" in str(tf_err):
+            if model_registry.is_tensorflow_error(tf_err) and "incompatible with the layer" in str(tf_err):
                 return jsonify({
                     "isMatch": False,
                     "averageSimilarity": 0,
@@ -245,6 +401,8 @@ def validate_signatures():
             else:
                 raise tf_err
 
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         print(f"Error in validate_signatures: {str(e)}")
         error_message = str(e)
@@ -265,6 +423,161 @@ def validate_signatures():
             "error": error_message
         })
 
+def _signature_features(files):
+    try:
+        with stage('upload'):
+            uploads = read_uploads(files)
+    except UploadError as e:
+        return None, (e.code, str(e))
+
+    keys = [upload.key for upload in uploads]
+    feature_namespace = f"features-{model_registry.model_fingerprint()}"
+
+    features = [signature_cache.get(f"{feature_namespace}:{key}") for key in keys]
+    missing = [index for index, feature in enumerate(features) if feature is None]
+
+    if missing:
+        batch = np.empty((len(missing), *IMAGE_SIZE[::-1], 3), dtype=np.float32)
+        decode_rows = []
+        for row, index in enumerate(missing):
+            processed = signature_cache.get(f"image:{keys[index]}")
+            if processed is not None:
+                batch[row] = processed[0]
+            else:
+                decode_rows.append((row, index))
+
+        try:
+            with stage('preprocess'):
+                preprocess_parallel(
+                    [uploads[index].stream for _, index in decode_rows],
+                    [batch[row] for row, _ in decode_rows]
+                )
+        except Exception as img_err:
+            if "has transparency" in str(img_err).lower():
+                return None, ("transparency_detected", "Please upload signatures without transparency (solid background only).")
+            return None, ("preprocessing_error", "Please ensure your signature images are clear and properly formatted.")
+
+        for row, index in decode_rows:
+            signature_cache.put(f"image:{keys[index]}", batch[row:row + 1])
+
+        try:
+            with stage('inference'):
+                conv_features, dense_features = model_registry.infer(batch)
+        except Exception as e:
+            if not (isinstance(e, ValueError) or model_registry.is_tensorflow_error(e, "InvalidArgumentError")):
+                raise
+            return None, ("image_format_error", "Please upload clearer signature images without transparency or special formats.")
+
+        for row, index in enumerate(missing):
+            features[index] = signature_cache.put(
+                f"{feature_namespace}:{keys[index]}",
+                (conv_features[row], dense_features[row])
+            )
+
+    return (np.stack([conv for conv, _ in features]), np.stack([dense for _, dense in features])), None
+
+@app.route('/api/signatures/enroll', methods=['POST'])
+def enroll_signatures():
+    user_id = request.form.get('user_id')
+    files = request.files.getlist('signatures')
+
+    if not user_id or not files:
+        return jsonify({"errorCode": "missing_fields", "error": "A user id and at least one signature file are required."}), 400
+
+    store_conv = request.form.get('store_conv', 'false').lower() in ('1', 'true', 'yes')
+    append = request.form.get('append', 'false').lower() in ('1', 'true', 'yes')
+
+    try:
+        features, error = _signature_features(files)
+        if error:
+            return jsonify({"errorCode": error[0], "error": error[1]}), 400
+
+        conv_features, dense_features = features
+        index = embedding_store.enroll(
+            user_id,
+            dense_features,
+            conv_features if store_conv else None,
+            append=append,
+            conv_descriptor=model_registry.CONV_DESCRIPTOR,
+            model_fingerprint=model_registry.model_fingerprint()
+        )
+
+        return jsonify({
+            "message": f"Enrolled {index['count']} signature reference(s).",
+            "userId": index["userId"],
+            "count": index["count"],
+            "storesConv": index["convDim"] is not None
+        }), 200
+
+    except StaleEnrollmentError as e:
+        return jsonify({"errorCode": "enrollment_stale", "error": str(e)}), 409
+    except ValueError as e:
+        return jsonify({"errorCode": "invalid_request", "error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in enroll_signatures: {str(e)}")
+        return jsonify({"errorCode": "general_error", "error": f"Failed to enroll signatures: {str(e)}"}), 500
+
+@app.route('/api/signatures/verify', methods=['POST'])
+def verify_signature():
+    user_id = request.form.get('user_id')
+    files = request.files.getlist('signature')
+
+    if not user_id or len(files) != 1:
+        return jsonify({"errorCode": "missing_fields", "error": "A user id and exactly one signature file are required."}), 400
+
+    try:
+        enrolled = embedding_store.load(user_id)
+        if enrolled is None:
+            return jsonify({"errorCode": "not_enrolled", "error": "No enrolled signatures found for this user."}), 404
+
+        reference_dense, reference_conv, index = enrolled
+
+        # References from another model (retrained, swapped or a different
+        # backend) would be scored against the wrong feature space.
+        if is_stale(index, model_registry.model_fingerprint()):
+            return jsonify({
+                "errorCode": "enrollment_stale",
+                "error": "Enrolled signatures were made with a different model. Please re-enroll this user."
+            }), 409
+
+        # Conv references extracted with another descriptor mode are not
+        # comparable, so fall back to dense-only scoring for them.
+        if reference_conv is not None and index.get("convDescriptor") != model_registry.CONV_DESCRIPTOR:
+            reference_conv = None
+
+        features, error = _signature_features(files)
+        if error:
+            return jsonify({"errorCode": error[0], "error": error[1]}), 400
+
+        conv_features, dense_features = features
+        with stage('similarity'):
+            scores = reference_similarities(dense_features, reference_dense)
+
+            # Same 0-100 scale as validation: conv + dense when both are enrolled,
+            # otherwise dense alone.
+            if reference_conv is not None:
+                scores = (scores + reference_similarities(conv_features, reference_conv)) * 50
+            else:
+                scores = scores * 100
+
+        average_similarity = float(np.mean(scores))
+        is_match = bool(average_similarity >= 85)
+        confidence = "high" if average_similarity >= 85 else "medium" if average_similarity >= 75 else "low"
+
+        return jsonify({
+            "isMatch": is_match,
+            "averageSimilarity": round(average_similarity, 2),
+            "bestSimilarity": round(float(np.max(scores)), 2),
+            "references": len(scores),
+            "confidence": confidence
+        }), 200
+
+    except ValueError as e:
+        return jsonify({"errorCode": "invalid_request", "error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in verify_signature: {str(e)}")
+        return jsonify({"errorCode": "general_error", "error": f"Failed to verify signature: {str(e)}"}), 500
+
 if __name__ == '__main__':    
     app.run()
 
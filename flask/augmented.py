@@ -1,24 +1,53 @@
 import numpy as np
-import tensorflow as tf
+import cv2
 from PIL import Image
-import random
-
-augment_datagen = tf.keras.preprocessing.image.ImageDataGenerator(
-    rescale=1./255,
-    zoom_range=0.01,
-    fill_mode='nearest',
-    preprocessing_function=lambda x: tf.image.resize(x, (150, 150))
-)
-
-def create_augmented_signature(signature_paths):
-    signature_path = random.choice(signature_paths)
-    
+
+ZOOM_RANGE = 0.01
+ROTATION_RANGE = 2.0
+STROKE_JITTER = 0.3
+
+
+def augment_signature(img_array, rng=None, zoom_range=ZOOM_RANGE, rotation_range=ROTATION_RANGE, stroke_jitter=STROKE_JITTER):
+    # Zoom and rotation are folded into one affine matrix about the image
+    # centre, so the whole geometric step is a single warpAffine on uint8 data.
+    rng = rng if rng is not None else np.random.default_rng()
+
+    height, width = img_array.shape[:2]
+    zx, zy = rng.uniform(1 - zoom_range, 1 + zoom_range, 2)
+    theta = np.deg2rad(rng.uniform(-rotation_range, rotation_range))
+
+    cos, sin = np.cos(theta), np.sin(theta)
+    linear = np.array([[cos, -sin], [sin, cos]]) @ np.diag([zx, zy])
+    center = np.array([(width - 1) / 2, (height - 1) / 2])
+    matrix = np.hstack([linear, (center - linear @ center)[:, np.newaxis]])
+
+    augmented = cv2.warpAffine(
+        img_array,
+        matrix,
+        (width, height),
+        flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+        borderMode=cv2.BORDER_REPLICATE
+    )
+
+    # Ink is dark on a light background: erode thickens strokes, dilate thins them.
+    roll = rng.random()
+    if roll < stroke_jitter / 2:
+        augmented = cv2.erode(augmented, np.ones((2, 2), np.uint8))
+    elif roll < stroke_jitter:
+        augmented = cv2.dilate(augmented, np.ones((2, 2), np.uint8))
+
+    return augmented
+
+
+def create_augmented_signature(signature_paths, seed=None):
+    rng = np.random.default_rng(seed)
+
+    signature_path = signature_paths[rng.integers(len(signature_paths))]
+
     img = Image.open(signature_path)
-    
+
     img_array = np.array(img)
-    
-    img_array = np.expand_dims(img_array, axis=0)
-    
-    augmented_img = augment_datagen.random_transform(img_array[0])
-    
-    return augmented_img
\ No newline at end of file
+
+    augmented_img = augment_signature(img_array, rng)
+
+    return augmented_img
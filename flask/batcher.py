@@ -0,0 +1,149 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    def __init__(self, run_batch, max_batch_size=32, max_wait_ms=5.0):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._pending_images = 0
+        self._batches = 0
+        self._images = 0
+        self._requests = 0
+        self._completed = 0
+        self._largest_batch = 0
+        self._last_batch_size = 0
+        self._batch_sizes = {}
+        self._total_wait = 0.0
+        self._total_run = 0.0
+
+    def _ensure_worker(self):
+        # Threads do not survive a fork, so a pre-forking server gets a fresh
+        # worker (and queue) in every child process.
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                with self._metrics_lock:
+                    self._pending_images = 0
+
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._worker, name="signature-batcher", daemon=True)
+            self._thread.start()
+
+    def submit(self, images):
+        batch = np.ascontiguousarray(images, dtype=np.float32)
+        if batch.ndim == 3:
+            batch = batch[np.newaxis, ...]
+
+        future = Future()
+        self._ensure_worker()
+
+        with self._metrics_lock:
+            self._pending_images += batch.shape[0]
+            self._requests += 1
+
+        self._queue.put((batch, future, time.perf_counter()))
+        return future
+
+    def run(self, images, timeout=None):
+        return self.submit(images).result(timeout=timeout)
+
+    def _collect(self, first):
+        items = [first]
+        size = first[0].shape[0]
+        carry = None
+        deadline = time.perf_counter() + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+
+            if size + item[0].shape[0] > self.max_batch_size:
+                carry = item
+                break
+
+            items.append(item)
+            size += item[0].shape[0]
+
+        return items, size, carry
+
+    def _worker(self):
+        carry = None
+
+        while True:
+            first = carry if carry is not None else self._queue.get()
+            items, size, carry = self._collect(first)
+
+            started = time.perf_counter()
+            batch = items[0][0] if len(items) == 1 else np.concatenate([item[0] for item in items], axis=0)
+
+            try:
+                outputs = self.run_batch(batch)
+            except Exception as e:
+                for _, future, _ in items:
+                    future.set_exception(e)
+                outputs = None
+
+            finished = time.perf_counter()
+
+            if outputs is not None:
+                offset = 0
+                for images, future, _ in items:
+                    count = images.shape[0]
+                    future.set_result(tuple(output[offset:offset + count] for output in outputs))
+                    offset += count
+
+            self._record(items, size, started, finished)
+
+    def _record(self, items, size, started, finished):
+        with self._metrics_lock:
+            self._pending_images -= size
+            self._batches += 1
+            self._images += size
+            self._completed += len(items)
+            self._last_batch_size = size
+            self._largest_batch = max(self._largest_batch, size)
+            self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+            self._total_wait += sum(started - enqueued for _, _, enqueued in items)
+            self._total_run += finished - started
+
+    def metrics(self):
+        with self._metrics_lock:
+            return {
+                "maxBatchSize": self.max_batch_size,
+                "maxWaitMs": round(self.max_wait * 1000, 3),
+                "queueDepth": self._queue.qsize(),
+                "pendingImages": self._pending_images,
+                "requests": self._requests,
+                "batches": self._batches,
+                "images": self._images,
+                "lastBatchSize": self._last_batch_size,
+                "largestBatchSize": self._largest_batch,
+                "averageBatchSize": round(self._images / self._batches, 3) if self._batches else 0,
+                "averageQueueWaitMs": round(self._total_wait / self._completed * 1000, 3) if self._completed else 0,
+                "averageRunMs": round(self._total_run / self._batches * 1000, 3) if self._batches else 0,
+                "batchSizes": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+            }
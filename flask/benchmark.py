@@ -0,0 +1,484 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    # Windows: peak RSS is reported as null.
+    resource = None
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import model_registry
+from preprocess import IMAGE_SIZE, preprocess_batch
+
+
+def synthetic_signature(width=1600, height=800, seed=0):
+    rng = np.random.default_rng(seed)
+    image = Image.new('RGB', (width, height), (250, 250, 248))
+    draw = ImageDraw.Draw(image)
+
+    stroke = max(2, width // 300)
+    for _ in range(6):
+        points = np.cumsum(rng.normal(0, width / 40, size=(40, 2)), axis=0)
+        points += (rng.uniform(0.2, 0.8) * width, rng.uniform(0.3, 0.7) * height)
+        draw.line([tuple(point) for point in points], fill=(20, 20, 30), width=stroke, joint='curve')
+
+    return image
+
+
+def encode(image, fmt):
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, quality=92) if fmt == 'JPEG' else image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def timed(func, runs):
+    func()
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "runs": runs,
+        "meanMs": round(statistics.fmean(samples), 3),
+        "p50Ms": round(samples[len(samples) // 2], 3),
+        "p95Ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "p99Ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+        "minMs": round(samples[0], 3),
+        "opsPerSec": round(1000 / statistics.fmean(samples), 2) if statistics.fmean(samples) else None,
+    }
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def legacy_preprocess(data):
+    # The pre-engine path: full decode, resize, then a float copy and a divide.
+    image = Image.open(io.BytesIO(data))
+    image = image.resize(IMAGE_SIZE)
+    return np.expand_dims(np.asarray(image, dtype=np.float32) / 255.0, axis=0)
+
+
+def bench_preprocess(args):
+    results = {}
+    image = synthetic_signature(args.width, args.height)
+
+    for fmt in ('JPEG', 'PNG'):
+        data = encode(image, fmt)
+        out = np.empty((1, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+        results[fmt.lower()] = {
+            "bytes": len(data),
+            "legacy": timed(lambda: legacy_preprocess(data), args.runs),
+            "engine": timed(lambda: preprocess_batch([data], out), args.runs),
+        }
+
+    return results
+
+
+STARTUP_PROBE = """
+import io, json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get('/api/status')
+first_status = time.perf_counter()
+result = {
+    "importMs": (imported - started) * 1000,
+    "firstStatusMs": (first_status - imported) * 1000,
+    "tensorflowImported": "tensorflow" in sys.modules,
+}
+if VALIDATE:
+    from benchmark import encode, synthetic_signature
+    files = [(io.BytesIO(encode(synthetic_signature(seed=i), 'PNG')), f'sig{i}.png') for i in range(3)]
+    before = time.perf_counter()
+    client.post('/api/validate-signatures', data={'signatures': files}, content_type='multipart/form-data')
+    result["firstValidateMs"] = (time.perf_counter() - before) * 1000
+    result["tensorflowImportedAfterValidate"] = "tensorflow" in sys.modules
+print(json.dumps(result))
+"""
+
+
+def legacy_render(image_array, ink_color='black'):
+    # The pre-fusion pipeline: full-resolution background removal, three
+    # np.where recolour passes and an in-place unsharp mask.
+    import cv2
+    from pad_signature import INK_COLORS, remove_signature_background
+
+    result = remove_signature_background(image_array).copy()
+    alpha = result[:, :, 3]
+    for i, value in enumerate(INK_COLORS[ink_color]):
+        result[:, :, i] = np.where(alpha > 0, value, result[:, :, i])
+    blurred = cv2.GaussianBlur(result, (9, 9), 10.0)
+    cv2.addWeighted(result, 1.5, blurred, -0.5, 0, result)
+    _, buffer = cv2.imencode('.png', result)
+    return buffer.tobytes()
+
+
+def bench_render(args):
+    from pad_signature import render_signature
+
+    results = {}
+    for width, height in ((1200, 600), (args.width * 2, args.height * 2)):
+        image = np.array(synthetic_signature(width, height))
+        results[f"{width}x{height}"] = {
+            "legacy": timed(lambda: legacy_render(image, 'blue'), args.runs),
+            "fused": timed(lambda: render_signature(image, 'blue'), args.runs),
+            "legacyPngBytes": len(legacy_render(image, 'blue')),
+            "fusedPngBytes": len(render_signature(image, 'blue')),
+        }
+    return results
+
+
+def bench_augment(args):
+    from augmented import augment_signature
+
+    image = np.array(synthetic_signature(args.width, args.height))
+    rng = np.random.default_rng(0)
+    results = {"numpy": timed(lambda: augment_signature(image, rng), args.runs)}
+
+    try:
+        tf = model_registry.import_tensorflow()
+    except ImportError:
+        results["imageDataGenerator"] = {"skipped": "tensorflow not installed"}
+        return results
+
+    generator = tf.keras.preprocessing.image.ImageDataGenerator(zoom_range=0.01, fill_mode='nearest')
+    results["imageDataGenerator"] = timed(lambda: generator.random_transform(image), args.runs)
+    return results
+
+
+def bench_startup(args):
+    # Each sample is a fresh interpreter so import caches do not hide the cost.
+    env = dict(os.environ, SIGNATURE_PRELOAD_MODEL='0')
+    probe = f"VALIDATE = {bool(args.validate)}\n" + STARTUP_PROBE
+    samples = []
+    for _ in range(max(1, args.startup_runs)):
+        completed = subprocess.run(
+            [sys.executable, '-c', probe],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    summary = {"runs": len(samples), "tensorflowImported": samples[-1]["tensorflowImported"]}
+    for key in ("importMs", "firstStatusMs", "firstValidateMs"):
+        values = [sample[key] for sample in samples if key in sample]
+        if values:
+            summary[key] = round(statistics.median(values), 3)
+    if "tensorflowImportedAfterValidate" in samples[-1]:
+        summary["tensorflowImportedAfterValidate"] = samples[-1]["tensorflowImportedAfterValidate"]
+    return summary
+
+
+BACKEND_PROBE = """
+import json, resource, sys, time
+import numpy as np
+import model_registry
+from benchmark import timed
+started = time.perf_counter()
+backend = model_registry.create_backend(BACKEND)
+loaded = time.perf_counter()
+result = {"loadMs": (loaded - started) * 1000, "tensorflowImported": "tensorflow" in sys.modules}
+for size in BATCH_SIZES:
+    batch = np.random.default_rng(size).random((size, 150, 150, 3), dtype=np.float32)
+    result[f"batch{size}"] = timed(lambda: model_registry.extract_features(batch, backend), RUNS)
+result["peakRssMb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps(result))
+"""
+
+
+def bench_backends(args):
+    # One interpreter per backend, so peak RSS and load time are not polluted
+    # by the other runtime.
+    results = {}
+    for name in model_registry.BACKENDS:
+        path = model_registry.backend_path(name)
+        if not os.path.exists(path):
+            results[name] = {"skipped": f"{path} not found"}
+            continue
+
+        probe = f"BACKEND = {name!r}\nBATCH_SIZES = {args.batch_sizes!r}\nRUNS = {args.runs}\n" + BACKEND_PROBE
+        completed = subprocess.run(
+            [sys.executable, '-c', probe],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True
+        )
+        if completed.returncode != 0:
+            results[name] = {"error": completed.stderr.strip().splitlines()[-1:]}
+            continue
+        results[name] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    return results
+
+
+# conv2d_2 (75x75x64) and dense_1 of the trained model.
+FEATURE_DIMS = (75 * 75 * 64, 256)
+
+
+def legacy_pair_similarity(conv, dense):
+    # The pre-vectorized route: calculate_similarity on every pair, per layer.
+    from similarities import calculate_similarity
+
+    scores = []
+    for i in range(len(conv)):
+        for j in range(i + 1, len(conv)):
+            scores.append(calculate_similarity(conv[i], conv[j]) + calculate_similarity(dense[i], dense[j]))
+    return sum(scores) / len(scores)
+
+
+def bench_similarity(args):
+    from similarities import average_pair_similarity
+
+    results = {}
+    for count in args.samples:
+        rng = np.random.default_rng(count)
+        conv = rng.random((count, FEATURE_DIMS[0]), dtype=np.float32)
+        dense = rng.random((count, FEATURE_DIMS[1]), dtype=np.float32)
+        results[f"samples{count}"] = {
+            "legacy": timed(lambda: legacy_pair_similarity(conv, dense), args.runs),
+            "matrix": timed(lambda: average_pair_similarity(conv, dense), args.runs),
+        }
+    return results
+
+
+def bench_background(args):
+    from pad_signature import apply_ink_color, remove_signature_background
+    from unsharpen import unsharpen_mask
+
+    image = np.array(synthetic_signature(args.width, args.height))
+    cleaned = remove_signature_background(image)
+    return {
+        "removeBackground": timed(lambda: remove_signature_background(image), args.runs),
+        "applyInkColor": timed(lambda: apply_ink_color(cleaned, 'blue'), args.runs),
+        "unsharpenMask": timed(lambda: unsharpen_mask(cleaned), args.runs),
+    }
+
+
+def bench_features(args):
+    from preprocess import preprocess_parallel
+
+    results = {}
+    for size in args.batch_sizes:
+        uploads = [encode(synthetic_signature(args.width, args.height, seed=seed), 'JPEG') for seed in range(size)]
+        batch = np.empty((size, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+        results[f"batch{size}"] = {
+            "preprocess": timed(lambda: preprocess_parallel(uploads, list(batch)), args.runs),
+        }
+
+    # Inference runs in-process here so it shows up in this run's peak RSS; the
+    # backends benchmark isolates each runtime in its own interpreter instead.
+    if not os.path.exists(model_registry.backend_path()):
+        results["extract"] = {"skipped": f"{model_registry.backend_path()} not found"}
+        return results
+
+    try:
+        backend = model_registry.load_model()
+    except Exception as e:
+        results["extract"] = {"skipped": str(e)}
+        return results
+
+    for size in args.batch_sizes:
+        batch = np.random.default_rng(size).random((size, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+        results[f"batch{size}"]["extract"] = timed(lambda: model_registry.extract_features(batch, backend), args.runs)
+    return results
+
+
+def synthetic_document(path, pages, signatories, lines_per_page=40):
+    # Filler text on every page, with the signatories at the end of the last
+    # one, the way approval sheets put the signature block.
+    import fitz
+
+    document = fitz.open()
+    for page_number in range(pages):
+        page = document.new_page()
+        for line in range(lines_per_page):
+            page.insert_text((72, 60 + line * 16), f"Section {page_number + 1}.{line + 1} filler text for the benchmark document.", fontsize=9)
+
+    page = document[-1]
+    for index, name in enumerate(signatories):
+        page.insert_text((72 + (index % 3) * 160, 720 - (index // 3) * 60), name, fontsize=10)
+
+    document.save(path)
+    document.close()
+
+
+def bench_pdf(args):
+    import fitz
+
+    import page_index
+    from pad_signature import find_last_occurrence, render_signature, sign_document
+
+    signatories = [f"Signatory {index:02d}" for index in range(6)]
+    stamp = render_signature(np.array(synthetic_signature(1200, 600)), 'black')
+    directory = tempfile.mkdtemp(prefix='signature-benchmark-')
+    results = {}
+
+    try:
+        for pages in args.pages:
+            source = os.path.join(directory, f"source-{pages}.pdf")
+            working = os.path.join(directory, f"document-{pages}.pdf")
+            synthetic_document(source, pages, signatories)
+            shutil.copyfile(source, working)
+
+            def cold_search():
+                page_index._cache.clear()
+                document = fitz.open(working)
+                try:
+                    find_last_occurrence(document, signatories[0], page_index.get_page_index(working, document))
+                finally:
+                    document.close()
+
+            def reset():
+                shutil.copyfile(source, working)
+
+            def sign_one():
+                reset()
+                sign_document(working, [{'name': signatories[0], 'signature': stamp}])
+
+            def sign_all():
+                reset()
+                sign_document(working, [{'name': name, 'signature': stamp} for name in signatories])
+
+            results[f"pages{pages}"] = {
+                "bytes": os.path.getsize(source),
+                "coldSearch": timed(cold_search, args.runs),
+                "copy": timed(reset, args.runs),
+                "signOne": timed(sign_one, args.runs),
+                "signBatch": timed(sign_all, args.runs),
+                "batchSize": len(signatories),
+            }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return results
+
+
+BENCHMARKS = {
+    "preprocess": bench_preprocess,
+    "startup": bench_startup,
+    "render": bench_render,
+    "augment": bench_augment,
+    "backends": bench_backends,
+    "similarity": bench_similarity,
+    "background": bench_background,
+    "features": bench_features,
+    "pdf": bench_pdf,
+}
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "recordedAt": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def latencies(results, path=()):
+    # p50 is the comparison metric: stable enough across runs on one machine,
+    # and present on every timed() entry.
+    for key, value in results.items():
+        if isinstance(value, dict):
+            if "p50Ms" in value:
+                yield '.'.join(path + (key,)), value["p50Ms"]
+            else:
+                yield from latencies(value, path + (key,))
+
+
+def compare(results, baseline, threshold):
+    previous = dict(latencies(baseline))
+    rows = []
+    for name, current in latencies(results):
+        if name not in previous or not previous[name]:
+            continue
+        ratio = current / previous[name]
+        rows.append({
+            "benchmark": name,
+            "baselineP50Ms": previous[name],
+            "currentP50Ms": current,
+            "ratio": round(ratio, 3),
+            "regression": ratio > threshold,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the signature service hot paths.")
+    parser.add_argument('benchmarks', nargs='*', help=f"Benchmarks to run (default: all). Available: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--width', type=int, default=1600)
+    parser.add_argument('--height', type=int, default=800)
+    parser.add_argument('--startup-runs', type=int, default=3)
+    parser.add_argument('--validate', action='store_true', help="Also time the first /api/validate-signatures call (loads the model).")
+    parser.add_argument('--batch-sizes', type=lambda value: [int(size) for size in value.split(',')], default=[1, 5, 10])
+    parser.add_argument('--samples', type=lambda value: [int(count) for count in value.split(',')], default=[3, 10],
+                        help="Signature counts for the similarity benchmark.")
+    parser.add_argument('--pages', type=lambda value: [int(count) for count in value.split(',')], default=[1, 20, 100],
+                        help="Page counts of the generated PDFs for the pdf benchmark.")
+    parser.add_argument('--save-baseline', metavar='PATH', help="Write this run as a JSON baseline.")
+    parser.add_argument('--compare', metavar='PATH', help="Compare p50 latencies against a saved baseline.")
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help="Ratio over the baseline p50 that counts as a regression (default: 1.2).")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmark(s): {', '.join(unknown)}")
+
+    results = {}
+    # The code under test prints progress (signature placed, model loaded);
+    # keep stdout for the JSON report.
+    with contextlib.redirect_stdout(sys.stderr):
+        for name in args.benchmarks or list(BENCHMARKS):
+            results[name] = BENCHMARKS[name](args)
+            # The high-water mark of this process so far, so a section that
+            # allocates more than its predecessors shows up as a step.
+            results[name]["peakRssMb"] = peak_rss_mb()
+
+    report = {"environment": environment(), "results": results}
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        report["comparison"] = compare(results, baseline["results"], args.threshold)
+        regressions = [row for row in report["comparison"] if row["regression"]]
+        for row in regressions:
+            print(f"REGRESSION {row['benchmark']}: {row['baselineP50Ms']}ms -> {row['currentP50Ms']}ms (x{row['ratio']})", file=sys.stderr)
+
+    print(json.dumps(report, indent=2))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,234 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from preprocess import list_images
+
+# Re-validates signature sets offline, e.g. the whole archive of enrolled
+# users overnight. Input is a directory with one sub-directory of images per
+# user, or a manifest (.jsonl / .json) of {"id": ..., "signatures": [paths]}.
+# Results stream out as JSON lines; the output file doubles as the checkpoint.
+
+MATCH_THRESHOLD = 85
+MEDIUM_THRESHOLD = 75
+INCONSISTENT_THRESHOLD = 60
+
+
+def load_manifest(path):
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path) as manifest_file:
+        if path.endswith('.jsonl'):
+            entries = [json.loads(line) for line in manifest_file if line.strip()]
+        else:
+            entries = json.load(manifest_file)
+
+    sets = []
+    for entry in entries:
+        paths = [p if os.path.isabs(p) else os.path.join(base_dir, p) for p in entry['signatures']]
+        sets.append((str(entry['id']), paths))
+    return sets
+
+
+def load_directory(path):
+    sets = []
+    for name in sorted(os.listdir(path)):
+        user_dir = os.path.join(path, name)
+        if os.path.isdir(user_dir):
+            sets.append((name, list_images(user_dir)))
+    return sets
+
+
+def completed_ids(output_path):
+    # A crash can leave a half-written last line; cut it off so appended
+    # results start on a fresh line, and treat that set as not done.
+    if not os.path.exists(output_path):
+        return set()
+
+    with open(output_path, 'rb+') as output_file:
+        data = output_file.read()
+        if data and not data.endswith(b'\n'):
+            output_file.truncate(data.rfind(b'\n') + 1)
+            data = data[:data.rfind(b'\n') + 1]
+
+    done = set()
+    for line in data.decode('utf-8').splitlines():
+        try:
+            done.add(json.loads(line)['id'])
+        except (ValueError, KeyError):
+            continue
+    return done
+
+
+def score(set_id, count, raw_similarity, threshold):
+    result = {"id": set_id, "count": count}
+    if raw_similarity is None:
+        result.update(success=False, errorCode="no_comparisons", error="Could not compare signatures.")
+        return result
+
+    average_similarity = raw_similarity * 50
+    result.update(
+        success=True,
+        averageSimilarity=round(average_similarity, 2),
+        rawSimilarity=round(raw_similarity, 4),
+        isMatch=bool(average_similarity >= threshold),
+        confidence="high" if average_similarity >= MATCH_THRESHOLD else "medium" if average_similarity >= MEDIUM_THRESHOLD else "low",
+    )
+    if average_similarity < INCONSISTENT_THRESHOLD:
+        result["errorCode"] = "inconsistent_signatures"
+    return result
+
+
+def init_worker():
+    # stdout is the result stream in the parent; anything a worker or the
+    # libraries it loads writes there (at Python or C level) goes to stderr.
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+
+def validate_chunk(sets, batch_size, threshold):
+    # Runs in a pool process: the model is loaded on the first chunk and reused
+    # for every later one, and all images of the chunk share forward passes.
+    import model_registry
+    from preprocess import IMAGE_SIZE, preprocess_into
+    from similarities import average_pair_similarity
+
+    started = time.perf_counter()
+    results = []
+    valid = []
+    images = []
+
+    for set_id, paths in sets:
+        batch = np.empty((len(paths), IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+        try:
+            for row, path in enumerate(paths):
+                try:
+                    preprocess_into(path, batch[row])
+                except ValueError as e:
+                    raise ValueError(f"{os.path.basename(path)}: {e}")
+        except ValueError as e:
+            results.append({"id": set_id, "count": len(paths), "success": False, "errorCode": "preprocessing_error", "error": str(e)})
+            continue
+
+        valid.append((set_id, len(paths)))
+        images.append(batch)
+
+    if valid:
+        images = np.concatenate(images)
+        conv_parts, dense_parts = [], []
+        for start in range(0, len(images), batch_size):
+            conv, dense = model_registry.extract_features(images[start:start + batch_size])
+            conv_parts.append(conv)
+            dense_parts.append(dense)
+        conv_features = np.concatenate(conv_parts)
+        dense_features = np.concatenate(dense_parts)
+
+        offset = 0
+        for set_id, count in valid:
+            rows = slice(offset, offset + count)
+            offset += count
+            results.append(score(set_id, count, average_pair_similarity(conv_features[rows], dense_features[rows]), threshold))
+
+    return results, len(images) if valid else 0, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate many users' signature sets offline.")
+    parser.add_argument('source', help="Directory with one sub-directory per user, or a .jsonl/.json manifest")
+    parser.add_argument('--output', '-o', help="JSON-lines output file (default: stdout)")
+    parser.add_argument('--resume', action='store_true', help="Skip sets already present in --output")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) // 2),
+                        help="Processes, each with its own model")
+    parser.add_argument('--threads-per-worker', type=int, default=None,
+                        help="Inference threads per process (default: cores / workers)")
+    parser.add_argument('--chunk-size', type=int, default=8, help="Signature sets per task")
+    parser.add_argument('--batch-size', type=int, default=32, help="Images per forward pass")
+    parser.add_argument('--min-samples', type=int, default=3, help="Smallest set that is compared (as the API requires)")
+    parser.add_argument('--threshold', type=float, default=MATCH_THRESHOLD, help="averageSimilarity needed for isMatch")
+    args = parser.parse_args()
+
+    if args.resume and not args.output:
+        parser.error("--resume needs --output, which is the checkpoint")
+
+    sets = load_directory(args.source) if os.path.isdir(args.source) else load_manifest(args.source)
+    total = len(sets)
+
+    done = completed_ids(args.output) if args.resume else set()
+    sets = [(set_id, paths) for set_id, paths in sets if set_id not in done]
+
+    output = open(args.output, 'a' if args.resume else 'w') if args.output else sys.stdout
+
+    def emit(result):
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+
+    pending = []
+    for set_id, paths in sets:
+        if len(paths) < args.min_samples:
+            emit({"id": set_id, "count": len(paths), "success": False, "errorCode": "insufficient_files",
+                  "error": f"At least {args.min_samples} signature samples are required."})
+        else:
+            pending.append((set_id, paths))
+
+    # Workers are spawned, not forked: TensorFlow state does not survive a
+    # fork, and spawned children read these before importing model_registry.
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+    os.environ.setdefault('SIGNATURE_TF_INTRA_OP_THREADS', str(threads))
+    os.environ.setdefault('SIGNATURE_TF_INTER_OP_THREADS', '1')
+    os.environ.setdefault('SIGNATURE_TFLITE_THREADS', str(threads))
+    os.environ.setdefault('SIGNATURE_BATCHING', '0')
+
+    chunks = [pending[start:start + args.chunk_size] for start in range(0, len(pending), args.chunk_size)]
+    print(f"{total} sets, {len(done)} already done, {len(pending)} to validate in {len(chunks)} chunks "
+          f"on {args.workers} workers x {threads} threads", file=sys.stderr)
+
+    started = time.perf_counter()
+    finished_sets = 0
+    finished_images = 0
+    failed = False
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_worker) as executor:
+            # Keep a bounded number of chunks in flight so a huge archive does
+            # not queue every path list up front.
+            remaining = iter(chunks)
+            in_flight = set()
+            for chunk in remaining:
+                in_flight.add(executor.submit(validate_chunk, chunk, args.batch_size, args.threshold))
+                if len(in_flight) >= args.workers * 2:
+                    break
+
+            while in_flight:
+                completed, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    results, images, _ = future.result()
+                    for result in results:
+                        emit(result)
+                    finished_sets += len(results)
+                    finished_images += images
+
+                    chunk = next(remaining, None)
+                    if chunk is not None:
+                        in_flight.add(executor.submit(validate_chunk, chunk, args.batch_size, args.threshold))
+
+                elapsed = time.perf_counter() - started
+                print(f"{finished_sets}/{len(pending)} sets, {finished_images / elapsed:.1f} images/s", file=sys.stderr)
+    except Exception as e:
+        # Whatever was emitted is kept; rerun with --resume to continue.
+        print(f"Error in bulk validation: {e}", file=sys.stderr)
+        failed = True
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
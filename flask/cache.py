@@ -0,0 +1,135 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def content_key(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _as_arrays(value):
+    return value if isinstance(value, tuple) else (value,)
+
+
+def _nbytes(value):
+    return sum(array.nbytes for array in _as_arrays(value))
+
+
+def _freeze(value):
+    # Copy so a cached row never pins the whole batch it was sliced from, and
+    # mark read-only so callers cannot mutate a shared entry.
+    arrays = []
+    for array in _as_arrays(value):
+        array = np.array(array, copy=True)
+        array.setflags(write=False)
+        arrays.append(array)
+    return tuple(arrays) if isinstance(value, tuple) else arrays[0]
+
+
+class ContentCache:
+    def __init__(self, max_bytes=256 * 1024 * 1024, disk_dir=None):
+        self.max_bytes = int(max_bytes)
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _disk_path(self, key):
+        namespace, _, digest = key.rpartition(':')
+        filename = f"{digest}.{namespace.replace(':', '-') or 'default'}.npz"
+        return os.path.join(self.disk_dir, digest[:2], filename)
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with np.load(self._disk_path(key)) as data:
+                arrays = [data[f"arr_{i}"] for i in range(len(data.files))]
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        return tuple(arrays) if len(arrays) > 1 else arrays[0]
+
+    def _write_disk(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, *_as_arrays(value))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing cache entry to disk: {e}")
+
+    def _insert(self, key, value):
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+
+            self._entries[key] = (value, size)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evictions += 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[0]
+
+        value = self._read_disk(key)
+        if value is None:
+            with self._lock:
+                self._misses += 1
+            return None
+
+        value = _freeze(value)
+        self._insert(key, value)
+        with self._lock:
+            self._disk_hits += 1
+        return value
+
+    def put(self, key, value):
+        value = _freeze(value)
+        self._insert(key, value)
+        self._write_disk(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self._hits,
+                "diskHits": self._disk_hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hitRate": round((self._hits + self._disk_hits) / lookups, 4) if lookups else 0,
+                "diskTier": bool(self.disk_dir),
+            }
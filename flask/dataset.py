@@ -0,0 +1,243 @@
+import argparse
+import hashlib
+import math
+import os
+import time
+from collections import namedtuple
+
+import tensorflow as tf
+
+from preprocess import list_images
+
+AUTOTUNE = tf.data.AUTOTUNE
+IMAGE_SIZE = (150, 150)
+
+# ImageDataGenerator's options and units: rotation and shear in degrees,
+# shift as a fraction of the image size.
+Augmentation = namedtuple('Augmentation', ['rotation', 'shift', 'shear', 'zoom', 'horizontal_flip'])
+
+# The ranges train1.py has always trained with; signatures are never flipped.
+DEFAULT_AUGMENTATION = Augmentation(rotation=10.0, shift=0.1, shear=0.1, zoom=0.1, horizontal_flip=False)
+
+
+def list_dataset(directory):
+    # Classes in sorted sub-directory order and files sorted within each, the
+    # order flow_from_directory uses, so label indices line up with models
+    # trained on either pipeline.
+    class_names = sorted(name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name)))
+    paths, labels = [], []
+    for index, name in enumerate(class_names):
+        class_paths = list_images(os.path.join(directory, name))
+        paths.extend(class_paths)
+        labels.extend([index] * len(class_paths))
+    return paths, labels, class_names
+
+
+def cache_key(paths):
+    # tf.data reuses an existing cache file as-is, so the name has to change
+    # whenever what would be decoded into it does: the file list, each file's
+    # mtime and size, and the decoded image size.
+    digest = hashlib.sha256(repr(IMAGE_SIZE).encode('utf-8'))
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}\n".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def decode(path, label):
+    # Decoded once and cached as uint8 at the model's input size: a quarter of
+    # the float32 footprint, and nothing is re-read or re-resized per epoch.
+    image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    # Area averaging is a box filter, close to the reduce step PIL applies in
+    # preprocess.py and half the cost of antialiased bicubic.
+    image = tf.image.resize(image, IMAGE_SIZE, method='area')
+    image = tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+    image.set_shape((*IMAGE_SIZE, 3))
+    return image, label
+
+
+def random_transforms(count, height, width, augmentation=DEFAULT_AUGMENTATION, seed=None):
+    # One projective transform per image combining rotation, shear, zoom,
+    # flip and shift about the centre, so augmentation is a single resampling
+    # pass over the whole batch instead of one per ImageDataGenerator option.
+    uniform = lambda low, high: tf.random.uniform((count,), low, high, seed=seed)
+    degrees = math.pi / 180
+
+    theta = uniform(-augmentation.rotation, augmentation.rotation) * degrees
+    shear = uniform(-augmentation.shear, augmentation.shear) * degrees
+    zx = uniform(1 - augmentation.zoom, 1 + augmentation.zoom)
+    zy = uniform(1 - augmentation.zoom, 1 + augmentation.zoom)
+    tx = uniform(-augmentation.shift, augmentation.shift) * tf.cast(width, tf.float32)
+    ty = uniform(-augmentation.shift, augmentation.shift) * tf.cast(height, tf.float32)
+
+    if augmentation.horizontal_flip:
+        zx *= tf.where(uniform(0.0, 1.0) < 0.5, -1.0, 1.0)
+
+    # Linear part (rotation @ shear @ zoom), mapping output pixels to input.
+    a = tf.cos(theta) * zx
+    b = (-tf.sin(theta + shear)) * zy
+    c = tf.sin(theta) * zx
+    d = tf.cos(theta + shear) * zy
+
+    cx = (tf.cast(width, tf.float32) - 1) / 2
+    cy = (tf.cast(height, tf.float32) - 1) / 2
+    zeros = tf.zeros((count,))
+
+    return tf.stack([
+        a, b, cx - a * cx - b * cy + tx,
+        c, d, cy - c * cx - d * cy + ty,
+        zeros, zeros,
+    ], axis=1)
+
+
+def augment(images, augmentation=DEFAULT_AUGMENTATION, seed=None):
+    shape = tf.shape(images)
+    return tf.raw_ops.ImageProjectiveTransformV3(
+        images=images,
+        transforms=random_transforms(shape[0], shape[1], shape[2], augmentation, seed),
+        output_shape=shape[1:3],
+        fill_value=0.0,
+        interpolation='BILINEAR',
+        fill_mode='NEAREST',
+    )
+
+
+def build_dataset(directory, batch_size, training=False, cache_dir=None, augmentation=DEFAULT_AUGMENTATION, seed=None):
+    paths, labels, class_names = list_dataset(directory)
+    num_classes = len(class_names)
+
+    dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+    dataset = dataset.map(decode, num_parallel_calls=AUTOTUNE)
+
+    # An empty filename caches in memory; otherwise tf.data writes its own
+    # on-disk cache shards there, reused across runs while the split is
+    # unchanged.
+    cache_file = ''
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        split = os.path.basename(os.path.normpath(directory))
+        cache_file = os.path.join(cache_dir, f"{split}-{cache_key(paths)}")
+    dataset = dataset.cache(cache_file)
+
+    if training:
+        dataset = dataset.shuffle(len(paths), seed=seed, reshuffle_each_iteration=True)
+
+    dataset = dataset.batch(batch_size)
+
+    def to_model_input(images, batch_labels):
+        images = tf.cast(images, tf.float32) / 255.0
+        if training:
+            images = augment(images, augmentation, seed)
+        return images, tf.one_hot(batch_labels, num_classes)
+
+    # Augmentation runs on whole batches in parallel with training, and the
+    # next batches are prepared while the current one is on the accelerator.
+    dataset = dataset.map(to_model_input, num_parallel_calls=AUTOTUNE)
+    dataset = dataset.prefetch(AUTOTUNE)
+
+    return dataset, labels, class_names
+
+
+class EpochTimer(tf.keras.callbacks.Callback):
+    def __init__(self):
+        super().__init__()
+        self.times = []
+        self.step_times = []
+        self._started = None
+        self._train_time = 0.0
+        self._steps = 0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._started = time.perf_counter()
+        self._steps = 0
+
+    def on_train_batch_end(self, batch, logs=None):
+        # Up to the last training step only, so step time leaves out the
+        # validation pass that closes each epoch.
+        self._train_time = time.perf_counter() - self._started
+        self._steps = batch + 1
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.times.append(time.perf_counter() - self._started)
+        if self._steps:
+            self.step_times.append(self._train_time / self._steps)
+        if logs is not None:
+            logs['epoch_time'] = self.times[-1]
+
+    def summary(self):
+        if not self.times:
+            return {}
+        # The first epoch pays for decoding, tracing and any XLA compilation;
+        # later ones show the steady state.
+        steady = self.times[1:] or self.times
+        summary = {
+            'First Epoch Time (s)': round(self.times[0], 2),
+            'Mean Epoch Time (s)': round(sum(steady) / len(steady), 2),
+        }
+        if self.step_times:
+            steady_steps = self.step_times[1:] or self.step_times
+            summary['Mean Step Time (ms)'] = round(sum(steady_steps) / len(steady_steps) * 1000, 1)
+        return summary
+
+
+def generator_dataset(directory, batch_size, training=False, augmentation=DEFAULT_AUGMENTATION):
+    # The ImageDataGenerator pipeline the training scripts have always used.
+    if training:
+        datagen = tf.keras.preprocessing.image.ImageDataGenerator(
+            rescale=1./255,
+            rotation_range=augmentation.rotation,
+            width_shift_range=augmentation.shift,
+            height_shift_range=augmentation.shift,
+            shear_range=augmentation.shear,
+            zoom_range=augmentation.zoom,
+            horizontal_flip=augmentation.horizontal_flip,
+            fill_mode='nearest'
+        )
+    else:
+        datagen = tf.keras.preprocessing.image.ImageDataGenerator(rescale=1./255)
+
+    return datagen.flow_from_directory(
+        directory,
+        target_size=IMAGE_SIZE,
+        batch_size=batch_size,
+        class_mode='categorical',
+        shuffle=training
+    )
+
+
+def time_epochs(batches, epochs):
+    times = []
+    for _ in range(epochs):
+        started = time.perf_counter()
+        for _ in batches():
+            pass
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def main():
+    # Input-pipeline throughput only (no model), so the numbers isolate what
+    # the generator vs tf.data costs per epoch.
+    parser = argparse.ArgumentParser(description="Compare epoch times of the generator and tf.data input pipelines.")
+    parser.add_argument('directory', nargs='?', default='./sign_data/train')
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--generator-batch-size', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--cache-dir', help="On-disk cache directory (default: in memory)")
+    args = parser.parse_args()
+
+    generator = generator_dataset(args.directory, args.generator_batch_size, training=True)
+    generator_times = time_epochs(lambda: (generator[index] for index in range(len(generator))), args.epochs)
+
+    dataset, labels, _ = build_dataset(args.directory, args.batch_size, training=True, cache_dir=args.cache_dir)
+    dataset_times = time_epochs(lambda: dataset, args.epochs)
+
+    print(f"{len(labels)} images, {args.epochs} epochs")
+    print(f"generator (batch {args.generator_batch_size}): " + ", ".join(f"{t:.2f}s" for t in generator_times))
+    print(f"tf.data   (batch {args.batch_size}): " + ", ".join(f"{t:.2f}s" for t in dataset_times))
+    steady = lambda times: sum(times[1:]) / len(times[1:]) if len(times) > 1 else times[0]
+    print(f"steady-state speedup: {steady(generator_times) / steady(dataset_times):.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+
+DESCRIPTOR_MODES = ('full', 'gap', 'gmp', 'gap-gmp', 'spp', 'pca')
+PYRAMID_LEVELS = (1, 2, 4)
+
+_pca_cache = {}
+
+
+def _as_maps(conv_maps):
+    conv_maps = np.asarray(conv_maps, dtype=np.float32)
+    if conv_maps.ndim == 3:
+        conv_maps = conv_maps[np.newaxis, ...]
+    return conv_maps
+
+
+def spatial_pyramid(conv_maps, levels=PYRAMID_LEVELS):
+    conv_maps = _as_maps(conv_maps)
+    count, height, width, channels = conv_maps.shape
+
+    cells = []
+    for level in levels:
+        rows = np.linspace(0, height, level + 1).astype(int)
+        cols = np.linspace(0, width, level + 1).astype(int)
+        for i in range(level):
+            for j in range(level):
+                cell = conv_maps[:, rows[i]:rows[i + 1], cols[j]:cols[j + 1], :]
+                cells.append(cell.max(axis=(1, 2)))
+
+    return np.concatenate(cells, axis=1).reshape(count, len(cells) * channels)
+
+
+def load_pca(path):
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _pca_cache:
+        with np.load(path) as data:
+            _pca_cache.clear()
+            _pca_cache[key] = (data["mean"].astype(np.float32), data["components"].astype(np.float32))
+    return _pca_cache[key]
+
+
+def fit_pca(descriptors, components=256):
+    descriptors = np.asarray(descriptors, dtype=np.float32)
+    mean = descriptors.mean(axis=0)
+    centered = descriptors - mean
+
+    _, singular_values, vt = np.linalg.svd(centered, full_matrices=False)
+    components = min(components, vt.shape[0])
+    explained = (singular_values ** 2)[:components].sum() / max((singular_values ** 2).sum(), 1e-12)
+    return mean, vt[:components], float(explained)
+
+
+def save_pca(path, mean, components):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez(path, mean=mean.astype(np.float32), components=components.astype(np.float32))
+
+
+def describe(conv_maps, mode='full', pca_path=None):
+    if mode == 'full':
+        conv_maps = np.asarray(conv_maps)
+        return conv_maps.reshape(conv_maps.shape[0], -1)
+
+    conv_maps = _as_maps(conv_maps)
+
+    # Pooled descriptors are a few hundred values per image, so float16 halves
+    # cache and store size without moving cosine scores noticeably.
+    if mode == 'gap':
+        descriptor = conv_maps.mean(axis=(1, 2))
+    elif mode == 'gmp':
+        descriptor = conv_maps.max(axis=(1, 2))
+    elif mode == 'gap-gmp':
+        descriptor = np.concatenate([conv_maps.mean(axis=(1, 2)), conv_maps.max(axis=(1, 2))], axis=1)
+    elif mode == 'spp':
+        descriptor = spatial_pyramid(conv_maps)
+    elif mode == 'pca':
+        # The projection is fitted on the spatial pyramid rather than the raw
+        # map; a components matrix over the flattened map would be hundreds of MB.
+        if not pca_path:
+            raise ValueError("PCA descriptor mode needs a fitted projection file.")
+        mean, components = load_pca(pca_path)
+        descriptor = (spatial_pyramid(conv_maps) - mean) @ components.T
+    else:
+        raise ValueError(f"Unknown conv descriptor mode: {mode}")
+
+    return descriptor.astype(np.float16)
@@ -0,0 +1,155 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from similarities import l2_normalize
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE_DIR = os.path.join(BASE_DIR, '..', 'storage', 'app', 'private', 'signature_embeddings')
+
+_USER_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class StaleEnrollmentError(ValueError):
+    pass
+
+
+def is_stale(index, model_fingerprint):
+    # Indexes written before fingerprints were recorded count as stale too:
+    # which model produced them is unknown.
+    return index.get("modelFingerprint") != model_fingerprint
+
+
+class EmbeddingStore:
+    def __init__(self, root=None, max_cached_users=128):
+        self.root = os.path.abspath(root or os.environ.get('SIGNATURE_EMBEDDINGS_DIR', DEFAULT_STORE_DIR))
+        self.max_cached_users = max(0, int(max_cached_users))
+        self._lock = threading.Lock()
+        # Separate from _lock, which enroll() holds while it calls load().
+        self._cache_lock = threading.Lock()
+        self._cache = OrderedDict()
+
+    def _user_dir(self, user_id):
+        user_id = str(user_id)
+        if not _USER_ID_PATTERN.match(user_id):
+            raise ValueError(f"Invalid user id: {user_id!r}")
+        return os.path.join(self.root, user_id)
+
+    def _read_index(self, user_dir):
+        try:
+            with open(os.path.join(user_dir, 'index.json'), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def enroll(self, user_id, dense_features, conv_features=None, append=False, conv_descriptor=None, model_fingerprint=None):
+        user_dir = self._user_dir(user_id)
+
+        # References are stored L2-normalized so verification is a single
+        # dot product per layer and never has to recompute their norms.
+        dense = l2_normalize(dense_features).astype(np.float32)
+        conv = None if conv_features is None else l2_normalize(conv_features).astype(np.float16)
+
+        with self._lock:
+            if append:
+                existing = self.load(user_id)
+                if existing is not None:
+                    old_dense, old_conv, old_index = existing
+                    # Embeddings of two models are not comparable, so they are
+                    # never mixed in one set.
+                    if is_stale(old_index, model_fingerprint):
+                        raise StaleEnrollmentError("Enrolled signatures were made with a different model; re-enroll without append.")
+                    if old_dense.shape[1] != dense.shape[1]:
+                        raise ValueError("Enrolled embeddings have a different dense dimension.")
+                    dense = np.concatenate([np.asarray(old_dense), dense], axis=0)
+                    if (conv is not None and old_conv is not None and old_conv.shape[1] == conv.shape[1]
+                            and old_index.get("convDescriptor") == conv_descriptor):
+                        conv = np.concatenate([np.asarray(old_conv), conv], axis=0)
+                    else:
+                        conv = None
+
+            os.makedirs(self.root, exist_ok=True)
+            staging = tempfile.mkdtemp(prefix=f".{user_id}-", dir=self.root)
+
+            try:
+                np.save(os.path.join(staging, 'dense.npy'), dense)
+                if conv is not None:
+                    np.save(os.path.join(staging, 'conv.npy'), conv)
+
+                index = {
+                    "userId": str(user_id),
+                    "count": int(dense.shape[0]),
+                    "denseDim": int(dense.shape[1]),
+                    "convDim": None if conv is None else int(conv.shape[1]),
+                    "convDescriptor": None if conv is None else conv_descriptor,
+                    "modelFingerprint": model_fingerprint,
+                    "updatedAt": time.time(),
+                }
+                with open(os.path.join(staging, 'index.json'), 'w') as f:
+                    json.dump(index, f)
+
+                # Swap the whole directory so readers never see a half-written set.
+                previous = None
+                if os.path.isdir(user_dir):
+                    previous = f"{staging}.old"
+                    os.replace(user_dir, previous)
+                os.replace(staging, user_dir)
+                if previous:
+                    shutil.rmtree(previous, ignore_errors=True)
+            except Exception:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+
+            self._forget(user_id)
+
+        return index
+
+    def _forget(self, user_id):
+        with self._cache_lock:
+            self._cache.pop(str(user_id), None)
+
+    def load(self, user_id):
+        user_dir = self._user_dir(user_id)
+        index = self._read_index(user_dir)
+        if index is None:
+            return None
+
+        key = str(user_id)
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[2]["updatedAt"] == index["updatedAt"]:
+                self._cache.move_to_end(key)
+                return cached
+
+        # dense is a few KB, so it is read outright; only the large conv set is
+        # memory-mapped. Each map holds a file descriptor until it is evicted,
+        # which is why the cache is bounded.
+        dense = np.load(os.path.join(user_dir, 'dense.npy'))
+        conv = None
+        if index.get("convDim"):
+            conv = np.load(os.path.join(user_dir, 'conv.npy'), mmap_mode='r')
+
+        entry = (dense, conv, index)
+        if self.max_cached_users:
+            with self._cache_lock:
+                self._cache[key] = entry
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.max_cached_users:
+                    self._cache.popitem(last=False)
+        return entry
+
+    def delete(self, user_id):
+        user_dir = self._user_dir(user_id)
+        with self._lock:
+            self._forget(user_id)
+            if os.path.isdir(user_dir):
+                shutil.rmtree(user_dir)
+                return True
+        return False
@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+import model_registry
+from descriptors import DESCRIPTOR_MODES, describe, fit_pca, save_pca, spatial_pyramid
+from preprocess import list_images, preprocess_batch
+from similarities import pairwise_similarity_matrix, upper_triangle
+
+THRESHOLDS = (60, 75, 85)
+
+
+def labelled_images(directory, limit_per_class=None):
+    paths, labels = [], []
+    for label in sorted(os.listdir(directory)):
+        class_dir = os.path.join(directory, label)
+        if not os.path.isdir(class_dir):
+            continue
+        class_paths = list_images(class_dir)
+        if limit_per_class:
+            class_paths = class_paths[:limit_per_class]
+        paths.extend(class_paths)
+        labels.extend([label] * len(class_paths))
+    return paths, np.array(labels)
+
+
+def extract_maps(paths, batch_size):
+    backend = model_registry.load_model()
+    conv_maps, dense_features = [], []
+    for start in range(0, len(paths), batch_size):
+        batch = preprocess_batch(paths[start:start + batch_size])
+        conv_output, dense_output = backend.extract(batch)
+        conv_maps.append(conv_output)
+        dense_features.append(dense_output.reshape(len(batch), -1))
+    return np.concatenate(conv_maps), np.concatenate(dense_features)
+
+
+def fit(args):
+    paths, _ = labelled_images(args.train_dir, args.per_class)
+    print(f"Fitting PCA on {len(paths)} images from {args.train_dir}")
+    conv_maps, _ = extract_maps(paths, args.batch_size)
+
+    mean, components, explained = fit_pca(spatial_pyramid(conv_maps), args.components)
+    save_pca(args.pca_path, mean, components)
+    print(f"Saved {args.pca_path}: {components.shape[0]} components, {explained * 100:.2f}% variance explained")
+
+
+def evaluate(args):
+    paths, labels = labelled_images(args.test_dir, args.per_class)
+    print(f"Evaluating on {len(paths)} images from {args.test_dir}")
+    conv_maps, dense_features = extract_maps(paths, args.batch_size)
+
+    dense_matrix = pairwise_similarity_matrix(dense_features)
+    genuine = upper_triangle(labels[:, None] == labels[None, :])
+
+    scores = {}
+    sizes = {}
+    for mode in args.modes:
+        if mode == 'pca' and not os.path.exists(args.pca_path):
+            print(f"Skipping pca: {args.pca_path} not found (run with --fit first)")
+            continue
+        descriptor = describe(conv_maps, mode, args.pca_path)
+        sizes[mode] = int(descriptor.shape[1] * descriptor.dtype.itemsize)
+        scores[mode] = upper_triangle(pairwise_similarity_matrix(descriptor, chunk_size=256) + dense_matrix) * 50
+
+    reference = scores['full']
+    report = {}
+    for mode, mode_scores in scores.items():
+        entry = {
+            "bytesPerImage": sizes[mode],
+            "maxScoreDifference": round(float(np.abs(mode_scores - reference).max()), 4),
+            "meanScoreDifference": round(float(np.abs(mode_scores - reference).mean()), 4),
+        }
+        for threshold in THRESHOLDS:
+            decisions = mode_scores >= threshold
+            entry[f"agreement@{threshold}"] = round(float(np.mean(decisions == (reference >= threshold))), 4)
+            entry[f"accuracy@{threshold}"] = round(float(np.mean(decisions == genuine)), 4)
+        report[mode] = entry
+
+    print(json.dumps(report, indent=2))
+
+    if args.min_agreement is not None:
+        failing = [
+            mode for mode, entry in report.items()
+            if entry[f"agreement@{args.decision_threshold}"] < args.min_agreement
+        ]
+        if failing:
+            raise SystemExit(f"Decisions diverge from the full-vector path for: {', '.join(failing)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit and evaluate reduced conv2d_2 descriptors against the full-vector path.")
+    parser.add_argument('--fit', action='store_true', help="Fit the PCA projection on the training split before evaluating.")
+    parser.add_argument('--train-dir', default='./sign_data/train')
+    parser.add_argument('--test-dir', default='./sign_data/test')
+    parser.add_argument('--pca-path', default=model_registry.CONV_PCA_PATH)
+    parser.add_argument('--components', type=int, default=256)
+    parser.add_argument('--per-class', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--modes', nargs='+', choices=DESCRIPTOR_MODES, default=list(DESCRIPTOR_MODES))
+    parser.add_argument('--decision-threshold', type=int, choices=THRESHOLDS, default=85)
+    parser.add_argument('--min-agreement', type=float, default=None, help="Fail if any mode agrees with the full path less often than this.")
+    args = parser.parse_args()
+
+    if 'full' not in args.modes:
+        args.modes.insert(0, 'full')
+
+    if args.fit:
+        fit(args)
+    evaluate(args)
+
+
+if __name__ == '__main__':
+    main()
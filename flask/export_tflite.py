@@ -0,0 +1,130 @@
+import argparse
+import os
+
+import numpy as np
+
+import model_registry
+from preprocess import list_images, preprocess_batch
+from similarities import pairwise_similarity_matrix, upper_triangle
+
+
+def representative_dataset(paths):
+    def generator():
+        for path in paths:
+            yield [preprocess_batch([path])]
+    return generator
+
+
+def export(model_path, output_path, quantize='none', calibration_paths=None):
+    tf = model_registry.import_tensorflow()
+
+    extractor = model_registry.build_extractor(tf.keras.models.load_model(model_path))
+    converter = tf.lite.TFLiteConverter.from_keras_model(extractor)
+
+    if quantize in ('dynamic', 'int8'):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if quantize == 'int8':
+        if not calibration_paths:
+            raise ValueError("int8 quantization needs calibration images (--calibration-dir).")
+        # Weights and activations go to int8; inputs and outputs stay float32 so
+        # the service feeds and reads the interpreter exactly like the float model.
+        converter.representative_dataset = representative_dataset(calibration_paths)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    tflite_model = converter.convert()
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+
+    return len(tflite_model)
+
+
+def pair_scores(backend, batch):
+    conv_features, dense_features = model_registry.extract_features(batch, backend)
+    matrix = pairwise_similarity_matrix(conv_features) + pairwise_similarity_matrix(dense_features)
+    return upper_triangle(matrix) * 50
+
+
+def check_parity(model_path, tflite_path, paths, tolerance):
+    batch = preprocess_batch(paths)
+
+    keras_scores = pair_scores(model_registry.create_backend('keras', model_path), batch)
+    tflite_scores = pair_scores(model_registry.create_backend('tflite', tflite_path), batch)
+
+    difference = np.abs(keras_scores - tflite_scores)
+    # The service thresholds scores at 60/75/85, so also count pairs whose
+    # decision would flip between backends.
+    flips = 0
+    for threshold in (60, 75, 85):
+        flips += int(np.sum((keras_scores >= threshold) != (tflite_scores >= threshold)))
+
+    return {
+        "pairs": int(difference.size),
+        "maxDifference": float(difference.max()) if difference.size else 0.0,
+        "meanDifference": float(difference.mean()) if difference.size else 0.0,
+        "thresholdFlips": flips,
+        "withinTolerance": bool(difference.size == 0 or difference.max() <= tolerance),
+    }
+
+
+def run_parity_check(args, tflite_path):
+    check_paths = list_images(args.check_dir, args.check_samples)
+    if len(check_paths) < 2:
+        print(f"Skipping parity check: fewer than 2 images in {args.check_dir}")
+        return
+
+    result = check_parity(args.model, tflite_path, check_paths, args.tolerance)
+    print(f"Parity over {result['pairs']} pairs: max diff {result['maxDifference']:.4f}, "
+          f"mean diff {result['meanDifference']:.4f}, threshold flips {result['thresholdFlips']}")
+
+    if not result["withinTolerance"]:
+        raise SystemExit(f"TFLite scores differ from Keras by more than {args.tolerance}; {args.output} left unchanged")
+    # A flip changes a match decision the service would return, which matters
+    # more than any score difference within tolerance.
+    if result["thresholdFlips"] > args.max_threshold_flips:
+        raise SystemExit(
+            f"TFLite changes {result['thresholdFlips']} accept/reject decisions "
+            f"(allowed: {args.max_threshold_flips}); {args.output} left unchanged"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the conv2d_2/dense_1 feature extractor to TFLite.")
+    parser.add_argument('--model', default=model_registry.MODEL_PATH)
+    parser.add_argument('--output', default=model_registry.TFLITE_PATH)
+    parser.add_argument('--quantize', choices=['none', 'dynamic', 'int8'], default='none')
+    parser.add_argument('--calibration-dir', default='./sign_data/train')
+    parser.add_argument('--calibration-samples', type=int, default=200)
+    parser.add_argument('--check-dir', default='./sign_data/test', help="Images used for the Keras/TFLite parity check.")
+    parser.add_argument('--check-samples', type=int, default=30)
+    parser.add_argument('--tolerance', type=float, default=1.0, help="Maximum allowed score difference (0-100 scale).")
+    parser.add_argument('--max-threshold-flips', type=int, default=0,
+                        help="Pairs allowed to change their accept/reject decision at 60/75/85 (default: none).")
+    parser.add_argument('--skip-check', action='store_true')
+    args = parser.parse_args()
+
+    calibration_paths = None
+    if args.quantize == 'int8':
+        calibration_paths = list_images(args.calibration_dir, args.calibration_samples)
+        print(f"Calibrating with {len(calibration_paths)} images from {args.calibration_dir}")
+
+    # The output path is what the service loads, so the export only replaces
+    # it once the parity check has passed.
+    staging_path = f"{args.output}.tmp"
+    size = export(args.model, staging_path, args.quantize, calibration_paths)
+    print(f"Exported {size / 1024 / 1024:.2f} MB, quantize={args.quantize}")
+
+    try:
+        if not args.skip_check:
+            run_parity_check(args, staging_path)
+        os.replace(staging_path, args.output)
+        print(f"Saved {args.output}")
+    finally:
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import os
+
+# Production entry point: gunicorn -c gunicorn.conf.py app:app
+# (run from this directory). Every setting can be overridden by environment.
+
+CPU_COUNT = os.cpu_count() or 1
+
+bind = os.environ.get('SIGNATURE_BIND', '127.0.0.1:5000')
+workers = int(os.environ.get('SIGNATURE_WORKERS', max(1, min(4, CPU_COUNT // 2))))
+worker_class = 'gthread'
+threads = int(os.environ.get('SIGNATURE_WORKER_THREADS', 8))
+timeout = int(os.environ.get('SIGNATURE_WORKER_TIMEOUT', 120))
+graceful_timeout = 30
+max_requests = int(os.environ.get('SIGNATURE_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+preload_app = True
+accesslog = '-'
+
+# Split the cores between workers so TensorFlow, TFLite, OpenCV and the
+# preprocess pool in each worker together stay within its share. This runs
+# before the app (and so model_registry) is imported, which reads these once.
+CORES_PER_WORKER = max(1, CPU_COUNT // workers)
+os.environ.setdefault('SIGNATURE_TF_INTRA_OP_THREADS', str(CORES_PER_WORKER))
+os.environ.setdefault('SIGNATURE_TF_INTER_OP_THREADS', '1')
+os.environ.setdefault('SIGNATURE_TFLITE_THREADS', str(CORES_PER_WORKER))
+os.environ.setdefault('SIGNATURE_PREPROCESS_WORKERS', str(min(8, CORES_PER_WORKER)))
+os.environ.setdefault('OMP_NUM_THREADS', str(CORES_PER_WORKER))
+
+# app.py would otherwise start its background model load in the master. A
+# thread does not survive the fork, and one holding the registry lock at fork
+# time would leave every worker blocked on it; workers load in post_fork.
+PRELOAD_MODEL = os.environ.get('SIGNATURE_PRELOAD_MODEL', '1') != '0'
+os.environ['SIGNATURE_PRELOAD_MODEL'] = '0'
+
+
+def when_ready(server):
+    # Import the inference runtime once in the master so its pages are shared
+    # copy-on-write by every worker instead of each paying the import. The model
+    # itself is built per worker: TensorFlow's thread pools do not survive a fork.
+    if not PRELOAD_MODEL:
+        return
+
+    import model_registry
+
+    try:
+        model_registry.import_runtime()
+        server.log.info("Inference runtime imported in master (%s backend).", model_registry.MODEL_BACKEND)
+    except Exception as e:
+        server.log.warning("Could not import the inference runtime in master: %s", e)
+
+
+def post_fork(server, worker):
+    import cv2
+
+    cv2.setNumThreads(CORES_PER_WORKER)
+
+    if PRELOAD_MODEL:
+        import model_registry
+
+        model_registry.preload_async()
@@ -0,0 +1,231 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    document TEXT,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_document_status ON jobs (document, status);
+"""
+
+STALE_ERROR = "The worker running this job stopped responding. It was not run again because it may have completed partially; check the document before retrying."
+
+
+class JobQueue:
+    def __init__(self, db_path, handlers, workers=2, poll_interval=0.5, stale_after=120, retention=86400):
+        self.db_path = db_path
+        self.handlers = handlers
+        self.workers = max(0, int(workers))
+        self.poll_interval = poll_interval
+        # A running job is only given up on once its process has not sent a
+        # heartbeat for stale_after seconds; how long the job itself runs does
+        # not matter.
+        self.stale_after = stale_after
+        self.heartbeat_interval = max(0.1, stale_after / 4)
+        self.retention = retention
+
+        self._threads = []
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._last_prune = 0.0
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+            columns = {row["name"] for row in connection.execute("PRAGMA table_info(jobs)")}
+            if "heartbeat_at" not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            yield connection
+        finally:
+            connection.close()
+
+    def ensure_workers(self):
+        # Threads do not survive a fork; every server process runs its own
+        # workers against the shared database.
+        if self._pid == os.getpid() or self.workers == 0:
+            return
+
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+
+            self._pid = os.getpid()
+            self._threads = []
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"signing-job-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+            thread = threading.Thread(target=self._heartbeat, name="signing-job-heartbeat", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _owner(self):
+        return f"{socket.gethostname()}:{os.getpid()}:"
+
+    def enqueue(self, kind, payload, document=None):
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        job_id = uuid.uuid4().hex
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, kind, payload, document, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(payload), document, time.time())
+            )
+
+        self.ensure_workers()
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+        if row is None:
+            return None
+
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "createdAt": row["created_at"],
+            "startedAt": row["started_at"],
+            "finishedAt": row["finished_at"],
+        }
+
+    def _claim(self):
+        worker = f"{self._owner()}{threading.get_ident()}"
+        now = time.time()
+
+        with self._connect() as connection:
+            # BEGIN IMMEDIATE takes the write lock up front, so two workers
+            # (threads or processes) can never claim the same row.
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs whose process stopped heartbeating are failed, not
+                # requeued: signing is not idempotent, and the process may
+                # have died after the document was already replaced.
+                connection.execute(
+                    """
+                    UPDATE jobs SET status = 'failed', error = ?, finished_at = ?
+                    WHERE status = 'running' AND COALESCE(heartbeat_at, started_at) < ?
+                    """,
+                    (STALE_ERROR, now, now - self.stale_after)
+                )
+                # Skip documents that already have a running job so signers of
+                # one PDF are applied one after another, in submission order.
+                row = connection.execute(
+                    """
+                    SELECT * FROM jobs
+                    WHERE status = 'queued'
+                      AND (document IS NULL OR document NOT IN (
+                          SELECT document FROM jobs WHERE status = 'running' AND document IS NOT NULL
+                      ))
+                    ORDER BY created_at
+                    LIMIT 1
+                    """
+                ).fetchone()
+
+                if row is not None:
+                    connection.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, started_at = ?, heartbeat_at = ? WHERE id = ?",
+                        (worker, now, now, row["id"])
+                    )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+        return row
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, None if result is None else json.dumps(result), error, time.time(), job_id)
+            )
+
+    def _heartbeat(self):
+        # One heartbeat per process covers every job its workers are running.
+        owner = self._owner()
+        while True:
+            time.sleep(self.heartbeat_interval)
+            try:
+                with self._connect() as connection:
+                    connection.execute(
+                        "UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND substr(worker, 1, ?) = ?",
+                        (time.time(), len(owner), owner)
+                    )
+            except sqlite3.Error as e:
+                print(f"Error recording signing job heartbeat: {e}")
+
+    def _prune(self):
+        now = time.time()
+        if now - self._last_prune < 3600:
+            return
+        self._last_prune = now
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?",
+                (now - self.retention,)
+            )
+
+    def _run(self, row):
+        return self.handlers[row["kind"]](json.loads(row["payload"]))
+
+    def _work(self):
+        while True:
+            try:
+                row = self._claim()
+            except sqlite3.Error as e:
+                print(f"Error claiming signing job: {e}")
+                row = None
+
+            if row is None:
+                self._prune()
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+
+            try:
+                result = self._run(row)
+                self._finish(row["id"], "succeeded", result=result)
+            except Exception as e:
+                print(f"Error in signing job {row['id']}: {e}")
+                self._finish(row["id"], "failed", error=str(e))
+
+    def stats(self):
+        with self._connect() as connection:
+            rows = connection.execute("SELECT status, COUNT(*) AS total FROM jobs GROUP BY status").fetchall()
+        counts = {row["status"]: row["total"] for row in rows}
+        counts["workers"] = self.workers
+        return counts
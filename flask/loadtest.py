@@ -0,0 +1,173 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark import encode, synthetic_signature
+from stress_signing import build_document
+
+# Drives a running server (dev server or gunicorn) with concurrent requests and
+# reports latency percentiles per endpoint. The sign target writes its fixture
+# PDFs and signature images under the Laravel storage directory the server reads.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STORAGE_DIR = os.path.join(BASE_DIR, '..', 'storage', 'app', 'private')
+SIGNATORY = "Load Test Signatory"
+TARGETS = ('validate', 'sign')
+
+
+def multipart(files):
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for field, filename, data in files:
+        body += f"--{boundary}\r\n".encode()
+        body += f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'.encode()
+        body += b"Content-Type: image/png\r\n\r\n"
+        body += data + b"\r\n"
+    body += f"--{boundary}--\r\n".encode()
+    return bytes(body), f"multipart/form-data; boundary={boundary}"
+
+
+def post(url, body, content_type, timeout):
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type}, method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b'{}')
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def validate_requests(url, samples, count):
+    # Every request gets its own images: the server caches features by content
+    # hash, so repeating one body would time cache hits after the first request
+    # instead of decode, batching and inference. Bodies are built up front so
+    # rendering stays out of the measured latency.
+    bodies = []
+    for index in range(count):
+        files = [
+            ('signatures', f"signature-{sample}.png",
+             encode(synthetic_signature(800, 400, seed=index * samples + sample), 'PNG'))
+            for sample in range(samples)
+        ]
+        bodies.append(multipart(files))
+
+    def request(index, timeout):
+        body, content_type = bodies[index]
+        status, payload = post(f"{url}/api/validate-signatures", body, content_type, timeout)
+        # The endpoint reports its own failures in a 200 body.
+        return status == 200 and payload is not None and not payload.get('errorCode')
+
+    return request
+
+
+def sign_requests(url, storage_dir, documents):
+    fixture_dir = os.path.join(storage_dir, 'loadtest')
+    os.makedirs(fixture_dir, exist_ok=True)
+
+    signature_path = os.path.join(fixture_dir, 'signature.png')
+    with open(signature_path, 'wb') as signature_file:
+        signature_file.write(encode(synthetic_signature(800, 400), 'PNG'))
+
+    # Several documents so the per-document lock measures signing, not queueing
+    # on a single file, unless --documents 1 is asked for explicitly.
+    payloads = []
+    for index in range(documents):
+        build_document(os.path.join(fixture_dir, f"document-{index}.pdf"), [SIGNATORY])
+        payloads.append(json.dumps({
+            'pdf': f"loadtest/document-{index}.pdf",
+            'signatory': SIGNATORY,
+            'signatures': ['loadtest/signature.png'],
+        }).encode())
+
+    def request(index, timeout):
+        status, _ = post(f"{url}/api/sign", payloads[index % len(payloads)], 'application/json', timeout)
+        return status == 200
+
+    return request
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def run(request, total, concurrency, timeout):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(index):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            ok = request(index, timeout)
+        except Exception:
+            ok = False
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(total)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughputRps": round(total / wall, 2),
+        "p50Ms": round(percentile(latencies, 0.50), 1),
+        "p95Ms": round(percentile(latencies, 0.95), 1),
+        "p99Ms": round(percentile(latencies, 0.99), 1),
+        "maxMs": round(latencies[-1], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the signature service.")
+    parser.add_argument('targets', nargs='*', help=f"Endpoints to load: {', '.join(TARGETS)} (default: all)")
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--warmup', type=int, default=5, help="Untimed requests per target before measuring")
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--samples', type=int, default=3, help="Signature images per validate request")
+    parser.add_argument('--documents', type=int, default=8, help="Fixture PDFs the sign target rotates over")
+    parser.add_argument('--storage-dir', default=STORAGE_DIR, help="Storage directory the server resolves paths against")
+    args = parser.parse_args()
+
+    unknown = [target for target in args.targets if target not in TARGETS]
+    if unknown:
+        parser.error(f"unknown target(s): {', '.join(unknown)}")
+
+    builders = {
+        'validate': lambda: validate_requests(args.url.rstrip('/'), args.samples, args.requests + args.warmup),
+        'sign': lambda: sign_requests(args.url.rstrip('/'), args.storage_dir, args.documents),
+    }
+
+    report = {}
+    for target in args.targets or TARGETS:
+        request = builders[target]()
+        # Warm-up uses indices past the measured ones, so it cannot prime the
+        # content cache for them.
+        for index in range(args.warmup):
+            request(args.requests + index, args.timeout)
+
+        report[target] = run(request, args.requests, args.concurrency, args.timeout)
+        print(f"{target}: {json.dumps(report[target])}", file=sys.stderr)
+
+    print(json.dumps(report, indent=2))
+    return 1 if any(result["errors"] for result in report.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import hashlib
+import os
+import threading
+from contextlib import ExitStack, contextmanager
+
+from tracing import stage
+
+try:
+    import fcntl
+except ImportError:
+    # Windows development machines only get the in-process lock.
+    fcntl = None
+
+LOCK_DIR = os.environ.get(
+    'SIGNATURE_LOCK_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'locks')
+)
+
+_guard = threading.Lock()
+_locks = {}
+
+
+def lock_path(path):
+    # Named by a hash of the real path and kept in our own directory, so the
+    # document storage Laravel manages never gets lock files next to its PDFs.
+    digest = hashlib.sha256(os.path.realpath(path).encode('utf-8')).hexdigest()
+    return os.path.join(LOCK_DIR, f"{digest}.lock")
+
+
+@contextmanager
+def _file_lock(path):
+    # The lock lives on a separate file rather than the document itself: saves
+    # replace the document's inode, which would silently drop a lock held on it.
+    if fcntl is None:
+        yield
+        return
+
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    fd = os.open(lock_path(path), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def document_lock(path):
+    # One lock per real path, dropped again once nobody holds or waits on it so
+    # the table does not grow with every document ever signed. Threads queue on
+    # the in-process lock first, so each process waits on the file lock once.
+    key = os.path.realpath(path)
+
+    with _guard:
+        entry = _locks.get(key)
+        if entry is None:
+            entry = _locks[key] = [threading.Lock(), 0]
+        entry[1] += 1
+
+    try:
+        with ExitStack() as held:
+            with stage('pdf_lock'):
+                held.enter_context(entry[0])
+                held.enter_context(_file_lock(key))
+            yield
+    finally:
+        with _guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                _locks.pop(key, None)
@@ -0,0 +1,286 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from batcher import MicroBatcher
+from descriptors import DESCRIPTOR_MODES, describe
+from tracing import stage
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.environ.get('SIGNATURE_MODEL_PATH', os.path.join(BASE_DIR, 'model.keras'))
+TFLITE_PATH = os.environ.get('SIGNATURE_TFLITE_PATH', os.path.join(BASE_DIR, 'models', 'feature_extractor.tflite'))
+MODEL_BACKEND = os.environ.get('SIGNATURE_MODEL_BACKEND', 'keras')
+CONV_DESCRIPTOR = os.environ.get('SIGNATURE_CONV_DESCRIPTOR', 'full')
+CONV_PCA_PATH = os.environ.get('SIGNATURE_CONV_PCA_PATH', os.path.join(BASE_DIR, 'models', 'conv_pca.npz'))
+TFLITE_THREADS = int(os.environ.get('SIGNATURE_TFLITE_THREADS', os.cpu_count() or 1))
+TF_INTRA_OP_THREADS = int(os.environ.get('SIGNATURE_TF_INTRA_OP_THREADS', 0))
+TF_INTER_OP_THREADS = int(os.environ.get('SIGNATURE_TF_INTER_OP_THREADS', 0))
+
+IMAGE_SIZE = (150, 150)
+FEATURE_LAYERS = ("conv2d_2", "dense_1")
+
+BATCHING_ENABLED = os.environ.get('SIGNATURE_BATCHING', '1') != '0'
+BATCH_MAX_SIZE = int(os.environ.get('SIGNATURE_BATCH_MAX_SIZE', 32))
+BATCH_MAX_WAIT_MS = float(os.environ.get('SIGNATURE_BATCH_MAX_WAIT_MS', 5))
+
+_lock = threading.Lock()
+_registry = {
+    "backend": None,
+    "loaded_at": None,
+    "load_time": None,
+    "warmup_time": None,
+    "import_time": None,
+    "loading": False,
+    "error": None,
+}
+
+
+def import_tensorflow():
+    # TensorFlow takes seconds to import and hundreds of MB once loaded, so it
+    # is only pulled in when the model is actually needed.
+    if "tensorflow" in sys.modules:
+        return sys.modules["tensorflow"]
+
+    os.environ.setdefault('TF_ENABLE_ONEDNN_OPTS', '0')
+    started = time.perf_counter()
+    import tensorflow as tf
+    _registry["import_time"] = time.perf_counter() - started
+
+    # 0 keeps TensorFlow's default of one thread per core, which oversubscribes
+    # the machine as soon as several server workers run inference at once.
+    if TF_INTRA_OP_THREADS:
+        tf.config.threading.set_intra_op_parallelism_threads(TF_INTRA_OP_THREADS)
+    if TF_INTER_OP_THREADS:
+        tf.config.threading.set_inter_op_parallelism_threads(TF_INTER_OP_THREADS)
+    return tf
+
+
+def import_runtime():
+    # Imports the inference runtime without building a model. Safe before a
+    # fork: TensorFlow only starts its thread pools once the first op runs.
+    if MODEL_BACKEND == "tflite":
+        try:
+            import tflite_runtime.interpreter
+            return
+        except ImportError:
+            pass
+    import_tensorflow()
+
+
+def is_tensorflow_error(error, name="OpError"):
+    tf = sys.modules.get("tensorflow")
+    return tf is not None and isinstance(error, getattr(tf.errors, name))
+
+
+def build_extractor(model):
+    tf = import_tensorflow()
+    return tf.keras.models.Model(
+        inputs=model.inputs,
+        outputs=[model.get_layer(name).output for name in FEATURE_LAYERS]
+    )
+
+
+class KerasBackend:
+    name = "keras"
+
+    def __init__(self, path):
+        tf = import_tensorflow()
+        self.path = path
+        self.extractor = build_extractor(tf.keras.models.load_model(path))
+
+        # A fixed input signature with an unknown batch dimension traces once
+        # and serves every batch size without retracing.
+        @tf.function(input_signature=[tf.TensorSpec(shape=(None, *IMAGE_SIZE, 3), dtype=tf.float32)])
+        def forward(images):
+            return self.extractor(images, training=False)
+
+        self.forward = forward
+
+    def extract(self, batch):
+        conv_output, dense_output = self.forward(batch)
+        return conv_output.numpy(), dense_output.numpy()
+
+
+class TFLiteBackend:
+    name = "tflite"
+
+    def __init__(self, path):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            Interpreter = import_tensorflow().lite.Interpreter
+
+        self.path = path
+        self.interpreter = Interpreter(model_path=path, num_threads=TFLITE_THREADS)
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.batch_size = None
+        # One interpreter holds one set of tensors, so invocations must not overlap.
+        self._lock = threading.Lock()
+
+    def _resize(self, batch_size):
+        self.interpreter.resize_tensor_input(self.input_index, [batch_size, *IMAGE_SIZE, 3])
+        self.interpreter.allocate_tensors()
+        self.batch_size = batch_size
+
+        # The converter does not keep the Keras output order, so tell the
+        # conv2d_2 map and the dense_1 vector apart by rank.
+        outputs = self.interpreter.get_output_details()
+        self.conv_index = next(detail["index"] for detail in outputs if len(detail["shape"]) == 4)
+        self.dense_index = next(detail["index"] for detail in outputs if len(detail["shape"]) == 2)
+
+    def extract(self, batch):
+        with self._lock:
+            if batch.shape[0] != self.batch_size:
+                self._resize(batch.shape[0])
+            self.interpreter.set_tensor(self.input_index, batch)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.conv_index), self.interpreter.get_tensor(self.dense_index)
+
+
+BACKENDS = {
+    KerasBackend.name: (KerasBackend, lambda: MODEL_PATH),
+    TFLiteBackend.name: (TFLiteBackend, lambda: TFLITE_PATH),
+}
+
+
+def backend_path(name=None):
+    return BACKENDS[name or MODEL_BACKEND][1]()
+
+
+def create_backend(name=None, path=None):
+    name = name or MODEL_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown model backend: {name}")
+    backend_class, default_path = BACKENDS[name]
+    return backend_class(path or default_path())
+
+
+def load_model():
+    if _registry["backend"] is not None:
+        return _registry["backend"]
+
+    with _lock:
+        if _registry["backend"] is not None:
+            return _registry["backend"]
+
+        _registry["loading"] = True
+        try:
+            if CONV_DESCRIPTOR not in DESCRIPTOR_MODES:
+                raise ValueError(f"Unknown conv descriptor mode: {CONV_DESCRIPTOR}")
+            with stage('model_load'):
+                started = time.perf_counter()
+                backend = create_backend()
+                loaded = time.perf_counter()
+
+                # The first call traces the graph and allocates kernels, so pay that
+                # once here instead of on the first user request.
+                backend.extract(np.zeros((1, *IMAGE_SIZE, 3), dtype=np.float32))
+                warmed = time.perf_counter()
+        except Exception as e:
+            _registry["error"] = str(e)
+            print(f"Error loading signature model: {e}", file=sys.stderr)
+            raise
+        finally:
+            _registry["loading"] = False
+
+        _registry["loaded_at"] = time.time()
+        _registry["load_time"] = loaded - started
+        _registry["warmup_time"] = warmed - loaded
+        _registry["error"] = None
+        _registry["backend"] = backend
+
+        # stderr, not stdout: command-line tools stream their results on stdout.
+        print(f"Signature model loaded from {backend.path} ({backend.name}) in {loaded - started:.2f}s (warmup {warmed - loaded:.2f}s).", file=sys.stderr)
+
+        return backend
+
+
+def preload_async():
+    def _preload():
+        try:
+            load_model()
+        except Exception:
+            # Already recorded in model_status(); requests retry the load.
+            pass
+
+    thread = threading.Thread(target=_preload, name="signature-model-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def extract_features(images, backend=None, descriptor=None):
+    backend = backend or load_model()
+
+    batch = np.ascontiguousarray(images, dtype=np.float32)
+    if batch.ndim == 3:
+        batch = batch[np.newaxis, ...]
+
+    conv_output, dense_output = backend.extract(batch)
+
+    count = batch.shape[0]
+    conv_features = describe(conv_output, descriptor or CONV_DESCRIPTOR, CONV_PCA_PATH)
+    return conv_features, dense_output.reshape(count, -1)
+
+
+_batcher = MicroBatcher(extract_features, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+
+
+def infer(images):
+    # Concurrent requests share forward passes through the micro-batcher; the
+    # direct path stays available for offline tools and for debugging.
+    if not BATCHING_ENABLED:
+        return extract_features(images)
+
+    load_model()
+    return _batcher.run(images)
+
+
+def batcher_metrics():
+    metrics = _batcher.metrics()
+    metrics["enabled"] = BATCHING_ENABLED
+    return metrics
+
+
+def model_fingerprint():
+    # Identifies the weights behind cached features, so a retrained model.keras
+    # (or a re-exported TFLite file, or another conv descriptor) never serves
+    # embeddings from its predecessor.
+    sources = [MODEL_BACKEND, CONV_DESCRIPTOR]
+    paths = [backend_path()]
+    if CONV_DESCRIPTOR == 'pca':
+        paths.append(CONV_PCA_PATH)
+
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            sources.append(f"{path}:{stat.st_mtime_ns}:{stat.st_size}")
+        except OSError:
+            sources.append(path)
+
+    source = "|".join(sources)
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+
+
+def model_status():
+    return {
+        "ready": _registry["backend"] is not None,
+        "backend": MODEL_BACKEND,
+        "convDescriptor": CONV_DESCRIPTOR,
+        "loading": _registry["loading"],
+        "tensorflowImported": "tensorflow" in sys.modules,
+        "importTime": None if _registry["import_time"] is None else round(_registry["import_time"], 3),
+        "threads": {
+            "intraOp": TF_INTRA_OP_THREADS or None,
+            "interOp": TF_INTER_OP_THREADS or None,
+            "tflite": TFLITE_THREADS,
+        },
+        "path": backend_path(),
+        "loadTime": None if _registry["load_time"] is None else round(_registry["load_time"], 3),
+        "warmupTime": None if _registry["warmup_time"] is None else round(_registry["warmup_time"], 3),
+        "loadedAt": _registry["loaded_at"],
+        "error": _registry["error"],
+    }
@@ -1,7 +1,15 @@
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
 import fitz  # PyMuPDF
 import cv2
 import numpy as np
 from unsharpen import unsharpen_mask
+from locks import document_lock
+from page_index import candidate_pages, get_page_index, index_page, store_page_index
+from tracing import stage
 
 def remove_signature_background(image_array):
     if len(image_array.shape) == 3 and image_array.shape[2] == 3:  # BGR
@@ -27,55 +35,110 @@ def remove_signature_background(image_array):
 
     return result_rgba
 
+INK_COLORS = {
+    'black': (0, 0, 0),         
+    'blue': (255, 0, 0),       
+}
+
+# Placement rect is 100x50 pt; rendering at a few pixels per point keeps the
+# stamp sharp in print without filtering a full-resolution scan.
+PLACEMENT_SIZE = (100, 50)
+RENDER_SCALE = float(os.environ.get('SIGNATURE_RENDER_SCALE', 4))
+
+_buffers = threading.local()
+
 def apply_ink_color(signature_image, ink_color='black'):
     result = signature_image.copy()
     
-    colors = {
-        'black': (0, 0, 0),         
-        'blue': (255, 0, 0),       
-    }
-    
-    if ink_color not in colors:
-        ink_color = 'black'
+    target_color = INK_COLORS.get(ink_color, INK_COLORS['black'])
     
-    target_color = colors[ink_color]
-    
-    alpha = result[:, :, 3]
-    
-    for i in range(3):
-        result[:, :, i] = np.where(alpha > 0, target_color[i], result[:, :, i])
+    result[result[:, :, 3] > 0, :3] = target_color
     
     return result
 
-def add_signature_above_name(pdf_path, signature_image_path, name, representative_name=None, ink_color='black'):
-    signature_with_transparent_bg = remove_signature_background(signature_image_path)
-    
-    colored_signature = apply_ink_color(signature_with_transparent_bg, ink_color)
-    
-    sharpened_signature = unsharpen_mask(colored_signature)
+def _buffer(name, shape, dtype=np.uint8):
+    pool = getattr(_buffers, 'pool', None)
+    if pool is None:
+        pool = _buffers.pool = {}
 
-    _, img_buffer = cv2.imencode('.png', sharpened_signature) 
-    img_bytes = img_buffer.tobytes() 
+    buffer = pool.get(name)
+    if buffer is None or buffer.shape != shape:
+        buffer = pool[name] = np.empty(shape, dtype=dtype)
+    return buffer
 
-    pdf_document = fitz.open(pdf_path)
-    
-    occurrences = []
-    for page_number in range(len(pdf_document)):
-        page = pdf_document[page_number]
-        text_instances = page.search_for(name)
-        
-        for rect in text_instances:
-            occurrences.append((page_number, rect))
-    
-    if not occurrences:
-        print(f"Name '{name}' not found in the document.")
-        pdf_document.close()
-        return False
-    
-    last_page_number, last_rect = occurrences[-1]
-    
-    page = pdf_document[last_page_number]
-    x1, y1, x2, y2 = last_rect
+def _downscale(image_array):
+    height, width = image_array.shape[:2]
+    max_width, max_height = (int(side * RENDER_SCALE) for side in PLACEMENT_SIZE)
+    scale = min(max_width / width, max_height / height)
+
+    if scale >= 1:
+        return image_array
+
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image_array, size, interpolation=cv2.INTER_AREA)
+
+def render_signature(signature_image, ink_color='black'):
+    # Fused version of remove_signature_background -> apply_ink_color ->
+    # unsharpen_mask. It works at placement resolution, reuses per-thread
+    # buffers, and skips the bitwise_and/cvtColor copies: every pixel the mask
+    # keeps is recoloured anyway, and the rest end up as zeros.
+    image = _downscale(np.asarray(signature_image))
+    height, width = image.shape[:2]
+
+    if image.ndim == 2:
+        gray = image
+    else:
+        code = cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        gray = cv2.cvtColor(image, code, dst=_buffer('gray', (height, width)))
+
+    thresh = cv2.adaptiveThreshold(
+        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 15, 10,
+        dst=_buffer('thresh', (height, width))
+    )
+
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, dst=_buffer('closed', (height, width)))
+    mask = cv2.GaussianBlur(closed, (5, 5), 0, dst=_buffer('mask', (height, width)))
+
+    rgba = _buffer('rgba', (height, width, 4))
+    rgba[:, :, :3] = 0
+    rgba[:, :, 3] = mask
+    rgba[mask > 0, :3] = INK_COLORS.get(ink_color, INK_COLORS['black'])
+
+    sharpened = unsharpen_mask(
+        rgba,
+        dst=_buffer('sharpened', (height, width, 4)),
+        blurred=_buffer('blurred', (height, width, 4))
+    )
+
+    _, img_buffer = cv2.imencode('.png', sharpened) 
+    return img_buffer.tobytes() 
+
+def find_last_occurrence(pdf_document, name, pages=None):
+    # Only the last occurrence is used, so scan pages from the end and stop at
+    # the first hit. With a page index, search_for only runs on pages whose text
+    # contains the name, and a name on no page is simply not found: that is the
+    # full scan the index exists to avoid. The full scan is kept only for when
+    # the index does list pages but search_for disagrees with it.
+    if pages is not None:
+        candidates = candidate_pages(pages, name)
+        if not candidates:
+            return None
+
+        for page_number in candidates:
+            text_instances = pdf_document[page_number].search_for(name)
+            if text_instances:
+                return page_number, text_instances[-1]
+
+    for page_number in reversed(range(len(pdf_document))):
+        text_instances = pdf_document[page_number].search_for(name)
+        if text_instances:
+            return page_number, text_instances[-1]
+
+    return None
+
+def place_signature(page, rect, img_bytes, representative_name=None):
+    x1, y1, x2, y2 = rect
     x = x1
     y = y1 - 50 - (-10)
     
@@ -100,19 +163,111 @@ def add_signature_above_name(pdf_path, signature_image_path, name, representativ
             fontname="hebo",
             color=(0.3, 0.3, 0.3)
         )
-    
-    if len(pdf_document) == 1:
-        print(f"Signature for '{name}' placed on the only page with {ink_color} ink.")
-    else:
-        print(f"Signature for '{name}' placed on page {last_page_number + 1} of {len(pdf_document)} with {ink_color} ink.")
-    
-    if representative_name:
-        print(f"Representative '{representative_name}' added below '{name}'.")
-    
-    pdf_document.save(pdf_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
-    pdf_document.close()
-    
-    return True
+
+@contextmanager
+def _working_copy(pdf_path):
+    # Incremental saves append to the file in place, so they go to a copy in
+    # the same directory that replaces the original only once fully written.
+    directory, name = os.path.split(os.path.abspath(pdf_path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix='.tmp', dir=directory)
+    os.close(fd)
+
+    try:
+        with stage('pdf_copy'):
+            shutil.copyfile(pdf_path, temp_path)
+            shutil.copymode(pdf_path, temp_path)
+        yield temp_path
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def _replace_durably(temp_path, pdf_path):
+    with open(temp_path, 'rb') as temp_file:
+        os.fsync(temp_file.fileno())
+
+    os.replace(temp_path, pdf_path)
+
+    # Persist the rename itself; not possible (or needed) on Windows.
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(os.path.dirname(os.path.abspath(pdf_path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+# Places every signatory with one open and one incremental save. Each placement
+# has 'name', 'signature' (image array or rendered PNG bytes) and optional
+# 'representative_name' / 'ink_color'; returns whether each name was found.
+def sign_document(pdf_path, placements):
+    # Serializes signers of the same PDF across threads and processes, and
+    # saves through a working copy so a crash never leaves a half-written file.
+    with document_lock(pdf_path), _working_copy(pdf_path) as working_path:
+        with stage('pdf_open'):
+            pdf_document = fitz.open(working_path)
+        results = []
+
+        try:
+            with stage('pdf_index'):
+                pages = get_page_index(pdf_path, pdf_document)
+
+            for placement in placements:
+                name = placement['name']
+                representative_name = placement.get('representative_name')
+                ink_color = placement.get('ink_color', 'black')
+
+                with stage('pdf_search'):
+                    occurrence = find_last_occurrence(pdf_document, name, pages)
+                if occurrence is None:
+                    print(f"Name '{name}' not found in the document.")
+                    results.append(False)
+                    continue
+
+                signature = placement['signature']
+                if isinstance(signature, bytes):
+                    img_bytes = signature
+                else:
+                    with stage('render'):
+                        img_bytes = render_signature(signature, ink_color)
+
+                last_page_number, last_rect = occurrence
+                with stage('pdf_insert'):
+                    place_signature(pdf_document[last_page_number], last_rect, img_bytes, representative_name)
+
+                    if representative_name:
+                        # The representative block is searchable text, so later
+                        # signatories must see it exactly as search_for would.
+                        pages[last_page_number] = index_page(pdf_document[last_page_number])
+
+                if len(pdf_document) == 1:
+                    print(f"Signature for '{name}' placed on the only page with {ink_color} ink.")
+                else:
+                    print(f"Signature for '{name}' placed on page {last_page_number + 1} of {len(pdf_document)} with {ink_color} ink.")
+            
+                if representative_name:
+                    print(f"Representative '{representative_name}' added below '{name}'.")
+
+                results.append(True)
+
+            if any(results):
+                with stage('pdf_save'):
+                    pdf_document.save(working_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+        finally:
+            pdf_document.close()
+
+        if any(results):
+            with stage('pdf_replace'):
+                _replace_durably(working_path, pdf_path)
+            store_page_index(pdf_path, pages)
+
+        return results
+
+def add_signature_above_name(pdf_path, signature_image_path, name, representative_name=None, ink_color='black'):
+    return sign_document(pdf_path, [{
+        'name': name,
+        'signature': signature_image_path,
+        'representative_name': representative_name,
+        'ink_color': ink_color,
+    }])[0]
 
 # import fitz  # PyMuPDF
 # import cv2
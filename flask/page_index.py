@@ -0,0 +1,56 @@
+import os
+import threading
+from collections import OrderedDict
+
+MAX_DOCUMENTS = int(os.environ.get('SIGNATURE_PAGE_INDEX_DOCUMENTS', 64))
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def normalize_text(text):
+    return ' '.join(text.lower().split())
+
+
+def index_page(page):
+    return normalize_text(' '.join(word[4] for word in page.get_text('words')))
+
+
+def _file_key(pdf_path):
+    stat = os.stat(pdf_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def get_page_index(pdf_path, pdf_document):
+    # One normalized text string per page, keyed by path plus mtime/size so an
+    # edit made outside this process rebuilds the index.
+    path = os.path.abspath(pdf_path)
+    key = _file_key(path)
+
+    with _lock:
+        entry = _cache.get(path)
+        if entry is not None and entry[0] == key and len(entry[1]) == len(pdf_document):
+            _cache.move_to_end(path)
+            return list(entry[1])
+
+    pages = [index_page(pdf_document[page_number]) for page_number in range(len(pdf_document))]
+    store_page_index(path, pages)
+    return list(pages)
+
+
+def store_page_index(pdf_path, pages):
+    # Called again after our own saves: the text we added is already folded
+    # into pages, so the index stays valid under the file's new mtime/size.
+    path = os.path.abspath(pdf_path)
+    key = _file_key(path)
+
+    with _lock:
+        _cache[path] = (key, tuple(pages))
+        _cache.move_to_end(path)
+        while len(_cache) > MAX_DOCUMENTS:
+            _cache.popitem(last=False)
+
+
+def candidate_pages(pages, name):
+    needle = normalize_text(name)
+    return [page_number for page_number in reversed(range(len(pages))) if needle in pages[page_number]]
@@ -1,74 +1,118 @@
-import fitz  # PyMuPDF
-import cv2
+import io
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 from PIL import Image
-import tensorflow as tf
-from unsharpen import unsharpen_mask
 
-def remove_signature_background(image_array):
-    if len(image_array.shape) == 3 and image_array.shape[2] == 3:  # BGR
-        img = cv2.cvtColor(image_array, cv2.COLOR_BGR2BGRA)
-    else:
-        img = image_array
+IMAGE_SIZE = (150, 150)
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+PREPROCESS_WORKERS = int(os.environ.get('SIGNATURE_PREPROCESS_WORKERS', min(8, os.cpu_count() or 1)))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def list_images(directory, limit=None, seed=0):
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(IMAGE_EXTENSIONS))
+    paths.sort()
 
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if limit and len(paths) > limit:
+        paths = random.Random(seed).sample(paths, limit)
+    return paths
 
-    thresh = cv2.adaptiveThreshold(
-        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 15, 10
-    )
 
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-    mask = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+def open_image(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(source))
+    return Image.open(source)
 
-    mask = cv2.GaussianBlur(mask, (5, 5), 0)
 
-    result = cv2.bitwise_and(img, img, mask=mask)
+def has_transparency(image):
+    if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+        alpha = image.convert('RGBA').getchannel('A')
+        return alpha.getextrema()[0] < 255
+    return False
 
-    result_rgba = cv2.cvtColor(result, cv2.COLOR_BGR2BGRA)
-    result_rgba[:, :, 3] = mask  
 
-    return result_rgba
+def _decode(source, size):
+    image = open_image(source)
 
-def add_signature_above_name(pdf_path, signature_image_path, name):
-    signature_with_transparent_bg = remove_signature_background(signature_image_path)
+    # JPEG can decode straight at 1/2, 1/4 or 1/8 scale, which skips most of the
+    # IDCT work for phone-camera scans. Other formats ignore the draft request.
+    if image.format == 'JPEG':
+        image.draft('RGB', (size[0] * 2, size[1] * 2))
 
-    sharpened_signature = unsharpen_mask(signature_with_transparent_bg)
+    if has_transparency(image):
+        raise ValueError("Image has transparency")
 
-    _, img_buffer = cv2.imencode('.png', sharpened_signature) 
-    
-    img_bytes = img_buffer.tobytes() 
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
 
-    pdf_document = fitz.open(pdf_path)
+    return image.resize(size, Image.BICUBIC, reducing_gap=3.0)
 
-    for page_number in range(len(pdf_document)):
-        page = pdf_document[page_number]
 
-        text_instances = page.search_for(name)
-        if not text_instances:
-            continue  
+def preprocess_into(source, out):
+    try:
+        image = _decode(source, (out.shape[1], out.shape[0]))
+        np.divide(np.asarray(image), np.float32(255.0), out=out)
+        return out
+
+    except Exception as e:
+        raise ValueError(f"Failed to preprocess the image. Error: {str(e)}")
 
-        for rect in text_instances:
-            x1, y1, x2, y2 = rect  
-            x = x1  
-            y = y1 - 50 - (-10)
 
-            signature_rect = fitz.Rect(x, y, x + 100, y + 50)
+def preprocess_batch(sources, out=None):
+    if out is None:
+        out = np.empty((len(sources), IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
 
-            page.insert_image(signature_rect, stream=img_bytes)
+    for index, source in enumerate(sources):
+        preprocess_into(source, out[index])
 
-    pdf_document.save(pdf_path, incremental=True, encryption=0)
-    pdf_document.close()
+    return out
 
 
 def preprocess_image(file):
-    try:
-        image = Image.open(file)
+    return preprocess_batch([file])
 
-        image = image.resize((150, 150))
 
-        image = tf.keras.preprocessing.image.img_to_array(image) / 255.0
+def _get_executor():
+    global _executor, _executor_pid
 
-        return np.expand_dims(image, axis=0)
+    # Worker threads do not survive a fork, so each process builds its own pool.
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS, thread_name_prefix='preprocess')
+                _executor_pid = os.getpid()
+    return _executor
 
-    except Exception as e:
-        raise ValueError(f"Failed to preprocess the image. Error: {str(e)}")
\ No newline at end of file
+
+def preprocess_parallel(sources, outs):
+    # PIL releases the GIL while decoding and resampling, so uploads decode
+    # concurrently. Results are checked in upload order, so the error raised is
+    # always that of the first bad file, as with sequential decoding, however
+    # the threads finish. It cancels whatever has not started yet and is
+    # re-raised unchanged so callers can still map it to an error code.
+    if len(sources) <= 1 or PREPROCESS_WORKERS <= 1:
+        for source, out in zip(sources, outs):
+            preprocess_into(source, out)
+        return outs
+
+    executor = _get_executor()
+    futures = [executor.submit(preprocess_into, source, out) for source, out in zip(sources, outs)]
+
+    try:
+        for future in futures:
+            future.result()
+    except Exception:
+        for future in futures:
+            future.cancel()
+        raise
+
+    return outs
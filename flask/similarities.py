@@ -29,6 +29,79 @@ def calculate_similarity(vector1, vector2):
         print(f"Error in calculate_similarity: {str(e)}")
         return 0.0
 
+# Up to this many rows the Gram matrix is built one matrix-vector product
+# per row: BLAS gemm has a fixed setup cost that dominates for the 3-10
+# samples a validation request sends, while each gemv streams the rows once.
+GEMV_MAX_ROWS = 12
+
+def as_rows(features):
+    features = np.asarray(features, dtype=np.float32)
+    if features.ndim == 1:
+        return features[np.newaxis, :]
+    if features.ndim > 2:
+        return features.reshape(features.shape[0], -1)
+    return features
+
+def l2_normalize(features):
+    features = as_rows(features)
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    normalized = np.zeros_like(features)
+    # Zero vectors stay zero, so they score 0.0 against everything just like
+    # calculate_similarity does.
+    np.divide(features, norms, out=normalized, where=norms > 0)
+    return normalized
+
+def gram_matrix(features, chunk_size=None):
+    count = features.shape[0]
+
+    if count <= GEMV_MAX_ROWS:
+        gram = np.empty((count, count), dtype=np.float32)
+        for i in range(count):
+            row = features[i:] @ features[i]
+            gram[i, i:] = row
+            gram[i:, i] = row
+    elif not chunk_size or count <= chunk_size:
+        gram = features @ features.T
+    else:
+        gram = np.empty((count, count), dtype=np.float32)
+        for start in range(0, count, chunk_size):
+            stop = min(start + chunk_size, count)
+            np.matmul(features[start:stop], features.T, out=gram[start:stop])
+
+    return gram
+
+def pairwise_similarity_matrix(features, chunk_size=None):
+    # Cosine similarities from the raw Gram matrix: the norms are its diagonal,
+    # so nothing the size of the features is copied or divided, only N x N.
+    gram = gram_matrix(as_rows(features), chunk_size)
+    norms = np.sqrt(np.diagonal(gram))
+    scale = np.outer(norms, norms)
+
+    matrix = np.zeros_like(gram)
+    np.divide(gram, scale, out=matrix, where=scale > 0)
+    return np.clip(matrix, 0, 1, out=matrix)
+
+def upper_triangle(matrix):
+    rows, cols = np.triu_indices(matrix.shape[0], k=1)
+    return matrix[rows, cols]
+
+def upper_triangle_mean(matrix):
+    values = upper_triangle(matrix)
+    if values.size == 0:
+        return None
+    return float(values.mean())
+
+def reference_similarities(sample, references):
+    # References are stored L2-normalized, so only the sample needs its norm.
+    query = l2_normalize(sample)[0]
+    scores = np.asarray(references, dtype=np.float32) @ query
+    return np.clip(scores, 0, 1)
+
+def average_pair_similarity(conv_features, dense_features, chunk_size=None):
+    matrix = pairwise_similarity_matrix(conv_features, chunk_size)
+    matrix += pairwise_similarity_matrix(dense_features, chunk_size)
+    return upper_triangle_mean(matrix)
+
 # def calculate_similarity(vector1, vector2):
 #     if isinstance(vector1, np.ndarray):
 #         vector1 = vector1.astype(float).tolist()
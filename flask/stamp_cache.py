@@ -0,0 +1,91 @@
+import hashlib
+import os
+import random
+import threading
+from collections import OrderedDict
+
+from augmented import create_augmented_signature
+from pad_signature import render_signature
+from tracing import stage
+
+
+def stamp_key(signature_paths, ink_color):
+    # Path plus mtime/size, so re-uploading a user's signature files renders a
+    # fresh pool instead of serving stamps of the old ones.
+    parts = [ink_color]
+    for path in sorted(signature_paths):
+        stat = os.stat(path)
+        parts.append(f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}")
+    return hashlib.sha256("|".join(parts).encode('utf-8')).hexdigest()
+
+
+class StampCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024, variants=5):
+        self.max_bytes = int(max_bytes)
+        self.variants = max(1, int(variants))
+        self._pools = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def render_pool(self, signature_paths, ink_color):
+        with stage('stamp_render'):
+            return tuple(
+                render_signature(create_augmented_signature(signature_paths), ink_color)
+                for _ in range(self.variants)
+            )
+
+    def _insert(self, key, pool):
+        size = sum(len(stamp) for stamp in pool)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._pools.pop(key, None)
+            if previous is not None:
+                self._bytes -= sum(len(stamp) for stamp in previous)
+
+            self._pools[key] = pool
+            self._bytes += size
+
+            while self._bytes > self.max_bytes and self._pools:
+                _, evicted = self._pools.popitem(last=False)
+                self._bytes -= sum(len(stamp) for stamp in evicted)
+                self._evictions += 1
+
+    def get_pool(self, signature_paths, ink_color):
+        key = stamp_key(signature_paths, ink_color)
+
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is not None:
+                self._pools.move_to_end(key)
+                self._hits += 1
+                return pool
+            self._misses += 1
+
+        pool = self.render_pool(signature_paths, ink_color)
+        self._insert(key, pool)
+        return pool
+
+    def get_stamp(self, signature_paths, ink_color):
+        return random.choice(self.get_pool(signature_paths, ink_color))
+
+    def warm(self, signature_paths, ink_colors=('black', 'blue')):
+        return {ink_color: len(self.get_pool(signature_paths, ink_color)) for ink_color in ink_colors}
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "pools": len(self._pools),
+                "variants": self.variants,
+                "bytes": self._bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hitRate": round(self._hits / lookups, 4) if lookups else 0,
+            }
@@ -0,0 +1,127 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import fitz
+
+from benchmark import encode, synthetic_signature
+from pad_signature import sign_document
+
+# Fires many signers at one PDF from several processes (and threads inside each)
+# and checks that every signatory ends up with a signature and the file is intact.
+
+
+def build_document(path, signatories, per_page=8):
+    document = fitz.open()
+    for start in range(0, len(signatories), per_page):
+        page = document.new_page()
+        for offset, name in enumerate(signatories[start:start + per_page]):
+            page.insert_text((72, 120 + offset * 80), name, fontsize=11)
+    document.save(path)
+    document.close()
+
+
+def signer(pdf_path, names, stamp, threads, failures):
+    def run(name):
+        try:
+            if not sign_document(pdf_path, [{'name': name, 'signature': stamp}])[0]:
+                failures.put(f"{name}: not found")
+        except Exception as e:
+            failures.put(f"{name}: {e}")
+
+    workers = []
+    for start in range(threads):
+        def chunk(names=names[start::threads]):
+            for name in names:
+                run(name)
+        worker = threading.Thread(target=chunk)
+        worker.start()
+        workers.append(worker)
+
+    for worker in workers:
+        worker.join()
+
+
+def verify(pdf_path, signatories):
+    document = fitz.open(pdf_path)
+    missing = []
+    try:
+        for name in signatories:
+            occurrence = None
+            for page in document:
+                rects = page.search_for(name)
+                if rects:
+                    occurrence = page, rects[-1]
+            if occurrence is None:
+                missing.append(f"{name}: text lost")
+                continue
+
+            page, rect = occurrence
+            # place_signature puts the stamp directly above the name.
+            if not any(abs(info['bbox'][3] - (rect.y0 + 10)) < 1 and abs(info['bbox'][0] - rect.x0) < 1
+                       for info in page.get_image_info()):
+                missing.append(f"{name}: no signature")
+
+        images = sum(len(page.get_image_info()) for page in document)
+    finally:
+        document.close()
+
+    return images, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent signing stress test for sign_document.")
+    parser.add_argument('--signatories', type=int, default=48)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=2)
+    parser.add_argument('--pdf', help="Where to write the test document (default: a temp file)")
+    args = parser.parse_args()
+
+    signatories = [f"Signatory {index:04d}" for index in range(args.signatories)]
+    pdf_path = args.pdf or os.path.join(tempfile.mkdtemp(prefix='stress-signing-'), 'document.pdf')
+    build_document(pdf_path, signatories)
+
+    stamp = encode(synthetic_signature(400, 200), 'PNG')
+    failures = multiprocessing.Queue()
+
+    started = time.perf_counter()
+    processes = [
+        multiprocessing.Process(
+            target=signer,
+            args=(pdf_path, signatories[index::args.processes], stamp, args.threads, failures)
+        )
+        for index in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    errors = []
+    while not failures.empty():
+        errors.append(failures.get())
+
+    images, missing = verify(pdf_path, signatories)
+
+    print(f"{len(signatories)} signatories, {args.processes} processes x {args.threads} threads, {elapsed:.2f}s")
+    print(f"document: {pdf_path}")
+    print(f"images placed: {images}, signer errors: {len(errors)}, missing: {len(missing)}")
+    for line in errors + missing:
+        print(f"  {line}")
+
+    leftovers = [name for name in os.listdir(os.path.dirname(os.path.abspath(pdf_path))) if name.endswith('.tmp')]
+    if leftovers:
+        print(f"  leftover working copies: {', '.join(leftovers)}")
+
+    ok = not errors and not missing and images == len(signatories) and not leftovers
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
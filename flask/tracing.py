@@ -0,0 +1,230 @@
+import contextvars
+import cProfile
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+SERVER_TIMING = os.environ.get('SIGNATURE_SERVER_TIMING', '0') != '0'
+PROFILE_RATE = float(os.environ.get('SIGNATURE_PROFILE_RATE', 0))
+PROFILE_DIR = os.environ.get(
+    'SIGNATURE_PROFILE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'profiles')
+)
+
+# Upper bounds in seconds, from a cache hit to a cold model load.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_trace = contextvars.ContextVar('signature_trace', default=None)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._requests = {}
+        self._statuses = {}
+
+    def observe_stage(self, name, seconds):
+        with self._lock:
+            histogram = self._stages.get(name)
+            if histogram is None:
+                histogram = self._stages[name] = Histogram()
+            histogram.observe(seconds)
+
+    def observe_request(self, endpoint, method, status, seconds):
+        with self._lock:
+            key = (endpoint, method)
+            histogram = self._requests.get(key)
+            if histogram is None:
+                histogram = self._requests[key] = Histogram()
+            histogram.observe(seconds)
+
+            status_key = (endpoint, method, str(status))
+            self._statuses[status_key] = self._statuses.get(status_key, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            copy = lambda histogram: (list(histogram.counts), histogram.total, histogram.count)
+            return (
+                {name: copy(histogram) for name, histogram in self._stages.items()},
+                {key: copy(histogram) for key, histogram in self._requests.items()},
+                dict(self._statuses),
+            )
+
+
+registry = Registry()
+
+
+class Trace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self):
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+@contextmanager
+def stage(name):
+    # Always feeds the process-wide histogram; also adds to the current
+    # request's trace when there is one (not in job or batcher threads).
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.observe_stage(name, elapsed)
+        trace = _trace.get()
+        if trace is not None:
+            trace.add(name, elapsed)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram_lines(name, labels, counts, total, count):
+    label_text = ','.join(f'{key}="{_label(value)}"' for key, value in labels)
+    prefix = f"{label_text}," if label_text else ""
+
+    lines = []
+    cumulative = 0
+    for bound, bucket in zip(BUCKETS + ('+Inf',), counts):
+        cumulative += bucket
+        lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+    lines.append(f"{name}_sum{{{label_text}}} {total:.6f}")
+    lines.append(f"{name}_count{{{label_text}}} {count}")
+    return lines
+
+
+def render_metrics(extra=()):
+    # Prometheus text exposition format 0.0.4. extra is an iterable of
+    # (name, type, help, value) where value is a number or [(labels, value), ...].
+    stages, requests, statuses = registry.snapshot()
+    lines = []
+
+    lines.append("# HELP signature_stage_duration_seconds Time spent in each processing stage.")
+    lines.append("# TYPE signature_stage_duration_seconds histogram")
+    for name in sorted(stages):
+        lines.extend(_histogram_lines("signature_stage_duration_seconds", (("stage", name),), *stages[name]))
+
+    lines.append("# HELP signature_request_duration_seconds Request latency by endpoint.")
+    lines.append("# TYPE signature_request_duration_seconds histogram")
+    for endpoint, method in sorted(requests):
+        lines.extend(_histogram_lines(
+            "signature_request_duration_seconds",
+            (("endpoint", endpoint), ("method", method)),
+            *requests[(endpoint, method)]
+        ))
+
+    lines.append("# HELP signature_requests_total Requests by endpoint and status code.")
+    lines.append("# TYPE signature_requests_total counter")
+    for endpoint, method, status in sorted(statuses):
+        lines.append(
+            f'signature_requests_total{{endpoint="{_label(endpoint)}",method="{method}",status="{status}"}} '
+            f'{statuses[(endpoint, method, status)]}'
+        )
+
+    for name, kind, help_text, value in extra:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        samples = value if isinstance(value, list) else [((), value)]
+        for labels, sample in samples:
+            if sample is None:
+                continue
+            label_text = ','.join(f'{key}="{_label(label)}"' for key, label in labels)
+            lines.append(f"{name}{{{label_text}}} {float(sample)}" if label_text else f"{name} {float(sample)}")
+
+    return "\n".join(lines) + "\n"
+
+
+# Only one request is profiled at a time: cProfile hooks the whole interpreter
+# on 3.12+, and overlapping profiles would mix unrelated requests anyway.
+_profile_lock = threading.Lock()
+
+
+def _start_profile():
+    if PROFILE_RATE <= 0 or random.random() >= PROFILE_RATE:
+        return None
+    if not _profile_lock.acquire(blocking=False):
+        return None
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        _profile_lock.release()
+        return None
+    return profiler
+
+
+def _save_profile(profiler, endpoint, seconds):
+    try:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = endpoint.strip('/').replace('/', '-').replace('<', '').replace('>', '') or 'root'
+        path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{name}-{seconds * 1000:.0f}ms.prof")
+        profiler.dump_stats(path)
+    except Exception as e:
+        print(f"Error saving request profile: {e}")
+    finally:
+        _profile_lock.release()
+
+
+def install(app):
+    from flask import g, request
+
+    @app.before_request
+    def _start_trace():
+        g.signature_trace_token = _trace.set(Trace())
+        g.signature_profiler = _start_profile()
+
+    @app.after_request
+    def _finish_trace(response):
+        trace = _trace.get()
+        if trace is None:
+            return response
+
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        elapsed = time.perf_counter() - trace.started
+        registry.observe_request(endpoint, request.method, response.status_code, elapsed)
+
+        if SERVER_TIMING:
+            response.headers['Server-Timing'] = trace.server_timing()
+
+        profiler = g.pop('signature_profiler', None)
+        if profiler is not None:
+            _save_profile(profiler, endpoint, elapsed)
+
+        return response
+
+    @app.teardown_request
+    def _end_trace(error=None):
+        profiler = g.pop('signature_profiler', None)
+        if profiler is not None:
+            # The request raised before after_request ran.
+            _save_profile(profiler, 'failed', 0.0)
+
+        token = g.pop('signature_trace_token', None)
+        if token is not None:
+            _trace.reset(token)
@@ -1,50 +1,35 @@
+import argparse
+
 import numpy as np
 import tensorflow as tf
 import matplotlib.pyplot as plt
 
+from dataset import Augmentation, EpochTimer, build_dataset, generator_dataset
+
+parser = argparse.ArgumentParser(description="Train the original signature CNN.")
+parser.add_argument('--pipeline', choices=('tfdata', 'generator'), default='tfdata')
+parser.add_argument('--batch-size', type=int, default=None, help="Default: 32 for tfdata, 5 for generator")
+parser.add_argument('--epochs', type=int, default=30)
+parser.add_argument('--cache-dir', help="Cache decoded images on disk here instead of in memory (tfdata only)")
+args = parser.parse_args()
 
 train_dir = "./sign_data/train"
 test_dir = "./sign_data/test"
 validate_dir = "./sign_data/validation"
 
 img_width, img_height = 150, 150  
-batch_size = 5  
-
-train_datagen = tf.keras.preprocessing.image.ImageDataGenerator(
-    rescale=1./255,
-    rotation_range=20,
-    width_shift_range=0.2,
-    height_shift_range=0.2,
-    shear_range=0.2,
-    zoom_range=0.2, 
-    horizontal_flip=True,
-    fill_mode='nearest',
-    preprocessing_function=lambda x: tf.image.resize(x, (img_width, img_height))
-)
+batch_size = args.batch_size or (32 if args.pipeline == 'tfdata' else 5)
 
-test_datagen = tf.keras.preprocessing.image.ImageDataGenerator(rescale=1./255)
-validate_datagen = tf.keras.preprocessing.image.ImageDataGenerator(rescale=1./255)
+augmentation = Augmentation(rotation=20, shift=0.2, shear=0.2, zoom=0.2, horizontal_flip=True)
 
-train_generator = train_datagen.flow_from_directory(
-    train_dir,
-    target_size=(img_width, img_height),
-    batch_size=batch_size,
-    class_mode='categorical'
-)
-
-test_generator = test_datagen.flow_from_directory(
-    test_dir,
-    target_size=(img_width, img_height),
-    batch_size=batch_size,
-    class_mode='categorical'
-)
-
-validate_generator = validate_datagen.flow_from_directory(
-    validate_dir,
-    target_size=(img_width, img_height),
-    batch_size=batch_size,
-    class_mode='categorical'
-)
+if args.pipeline == 'tfdata':
+    train_data, _, _ = build_dataset(train_dir, batch_size, training=True, cache_dir=args.cache_dir, augmentation=augmentation)
+    test_data, _, _ = build_dataset(test_dir, batch_size, cache_dir=args.cache_dir)
+    validate_data, _, _ = build_dataset(validate_dir, batch_size, cache_dir=args.cache_dir)
+else:
+    train_data = generator_dataset(train_dir, batch_size, training=True, augmentation=augmentation)
+    test_data = generator_dataset(test_dir, batch_size)
+    validate_data = generator_dataset(validate_dir, batch_size)
 
 model = tf.keras.Sequential([
     tf.keras.layers.Input(shape=(img_width, img_height, 3)), 
@@ -63,16 +48,18 @@ model.compile(optimizer='adam',
               loss='categorical_crossentropy',
               metrics=['accuracy'])
 
+epoch_timer = EpochTimer()
+
 history = model.fit(
-    train_generator,
-    steps_per_epoch=len(train_generator),
-    epochs=30, 
-    validation_data=validate_generator,
-    validation_steps=len(validate_generator),
+    train_data,
+    epochs=args.epochs,
+    validation_data=validate_data,
+    callbacks=[epoch_timer],
 )
+print(epoch_timer.summary())
 
 
-test_loss, test_acc = model.evaluate(test_generator, steps=len(test_generator))
+test_loss, test_acc = model.evaluate(test_data)
 print(f'Test accuracy: {test_acc}')
 
 model.save('models/model.keras')
@@ -1,3 +1,5 @@
+import argparse
+
 import numpy as np
 import tensorflow as tf
 import matplotlib.pyplot as plt
@@ -5,56 +7,70 @@ from sklearn.metrics import confusion_matrix, classification_report
 import seaborn as sns
 import pandas as pd
 
+from dataset import EpochTimer, build_dataset, generator_dataset
+
+parser = argparse.ArgumentParser(description="Train the signature CNN.")
+parser.add_argument('--pipeline', choices=('tfdata', 'generator'), default='tfdata',
+                    help="Input pipeline: cached tf.data (default) or the original ImageDataGenerator")
+parser.add_argument('--batch-size', type=int, default=None, help="Default: 32 for tfdata, 5 for generator")
+parser.add_argument('--epochs', type=int, default=100)
+parser.add_argument('--cache-dir', help="Cache decoded images on disk here instead of in memory (tfdata only)")
+parser.add_argument('--xla', action='store_true', help="Compile the train and predict steps with XLA (jit_compile)")
+parser.add_argument('--mixed-precision', choices=('bfloat16',), default=None,
+                    help="Compute in bfloat16 with float32 weights; models/model.keras is still saved as float32")
+args = parser.parse_args()
+
 train_dir = "./sign_data/train"
 test_dir = "./sign_data/test"
 validate_dir = "./sign_data/validation"
 
 img_width, img_height = 150, 150  
-batch_size = 5  
-
-train_datagen = tf.keras.preprocessing.image.ImageDataGenerator(
-    rescale=1./255,
-    rotation_range=10,  # Reduced from 20
-    width_shift_range=0.1,  # Reduced from 0.2
-    height_shift_range=0.1,
-    shear_range=0.1,
-    zoom_range=0.1,
-    horizontal_flip=False,  # Signatures shouldn't be flipped
-    fill_mode='nearest'
-)
+batch_size = args.batch_size or (32 if args.pipeline == 'tfdata' else 5)
+
+if args.pipeline == 'tfdata':
+    # Decoded once into a cache, augmented as batched map ops and prefetched,
+    # so the CPU prepares the next batches while the current one trains.
+    train_data, _, train_classes = build_dataset(train_dir, batch_size, training=True, cache_dir=args.cache_dir)
+    test_data, test_classes, class_labels = build_dataset(test_dir, batch_size, cache_dir=args.cache_dir)
+    validate_data, _, _ = build_dataset(validate_dir, batch_size, cache_dir=args.cache_dir)
+else:
+    train_data = generator_dataset(train_dir, batch_size, training=True)
+    train_classes = list(train_data.class_indices.keys())
+    test_data = generator_dataset(test_dir, batch_size)
+    validate_data = generator_dataset(validate_dir, batch_size)
+    test_classes = test_data.classes
+    class_labels = list(test_data.class_indices.keys())
 
-test_datagen = tf.keras.preprocessing.image.ImageDataGenerator(rescale=1./255)
-validate_datagen = tf.keras.preprocessing.image.ImageDataGenerator(rescale=1./255)
+# Get number of classes
+num_classes = len(train_classes)
+print(f'Number of classes: {num_classes}')
 
 
-train_generator = train_datagen.flow_from_directory(
-    train_dir,
-    target_size=(img_width, img_height),
-    batch_size=batch_size,
-    class_mode='categorical',
-    shuffle=True
-)
+def bfloat16_supported():
+    # bfloat16 needs native support to be any faster than float32: a GPU of
+    # compute capability 8.0+ or a CPU with AVX512-BF16 / AMX. Elsewhere it is
+    # emulated and only costs accuracy.
+    for gpu in tf.config.list_physical_devices('GPU'):
+        if tf.config.experimental.get_device_details(gpu).get('compute_capability', (0, 0)) >= (8, 0):
+            return True
+    try:
+        with open('/proc/cpuinfo') as cpuinfo:
+            flags = cpuinfo.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
 
-test_generator = test_datagen.flow_from_directory(
-    test_dir,
-    target_size=(img_width, img_height),
-    batch_size=batch_size,
-    class_mode='categorical',
-    shuffle=False
-)
 
-validate_generator = validate_datagen.flow_from_directory(
-    validate_dir,
-    target_size=(img_width, img_height),
-    batch_size=batch_size,
-    class_mode='categorical',
-    shuffle=False
-)
+mixed_precision = args.mixed_precision
+if mixed_precision and not bfloat16_supported():
+    print('bfloat16 is not supported natively on this machine; training in float32.')
+    mixed_precision = None
 
+training_mode = '+'.join(mode for mode in ('xla' if args.xla else None, mixed_precision) if mode) or 'float32'
+print(f'Training mode: {training_mode}')
 
-# Get number of classes
-num_classes = len(train_generator.class_indices)
-print(f'Number of classes: {num_classes}')
+if mixed_precision:
+    tf.keras.mixed_precision.set_global_policy('mixed_bfloat16')
 
 # Improved CNN Architecture with Dropout and Batch Normalization
 model = tf.keras.Sequential([
@@ -98,7 +114,9 @@ model = tf.keras.Sequential([
     tf.keras.layers.Dense(256, activation='relu'),
     tf.keras.layers.BatchNormalization(),
     tf.keras.layers.Dropout(0.5),
-    tf.keras.layers.Dense(num_classes, activation='softmax')
+    # Softmax stays float32 under mixed precision so the probabilities
+    # and the loss are computed at full precision.
+    tf.keras.layers.Dense(num_classes, activation='softmax', dtype='float32')
 ])
 
 # model = tf.keras.Sequential([
@@ -126,7 +144,8 @@ lr_schedule = tf.keras.optimizers.schedules.ExponentialDecay(
 model.compile(
     optimizer=tf.keras.optimizers.Adam(learning_rate=0.001),  # Use fixed value
     loss='categorical_crossentropy',
-    metrics=['accuracy', tf.keras.metrics.TopKCategoricalAccuracy(k=5, name='top_5_accuracy')]
+    metrics=['accuracy', tf.keras.metrics.TopKCategoricalAccuracy(k=5, name='top_5_accuracy')],
+    jit_compile=args.xla
 )
 
 print(model.summary())
@@ -153,16 +172,21 @@ model_checkpoint = tf.keras.callbacks.ModelCheckpoint(
     verbose=1
 )
 
+epoch_timer = EpochTimer()
+
 # Train with more epochs and callbacks
 history = model.fit(
-    train_generator,
-    steps_per_epoch=len(train_generator),
-    epochs=100,  # Increased epochs
-    validation_data=validate_generator,
-    validation_steps=len(validate_generator),
-    callbacks=[early_stopping, reduce_lr, model_checkpoint]
+    train_data,
+    epochs=args.epochs,
+    validation_data=validate_data,
+    callbacks=[early_stopping, reduce_lr, model_checkpoint, epoch_timer]
 )
 
+epoch_times = epoch_timer.summary()
+print(f'\n=== Epoch Times ({args.pipeline}, batch {batch_size}, {training_mode}) ===')
+for key, value in epoch_times.items():
+    print(f'{key}: {value}')
+
 # history = model.fit(
 #     train_generator,
 #     steps_per_epoch=len(train_generator),
@@ -172,7 +196,7 @@ history = model.fit(
 # )
 
 # Evaluate on test set - FIX: Unpack 3 values instead of 2
-test_results = model.evaluate(test_generator, steps=len(test_generator))
+test_results = model.evaluate(test_data)
 test_loss = test_results[0]
 test_acc = test_results[1]
 test_top5_acc = test_results[2]
@@ -182,8 +206,26 @@ print(f'Test Loss: {test_loss:.4f}')
 print(f'Test Accuracy: {test_acc:.4f} ({test_acc * 100:.2f}%)')
 print(f'Test Top-5 Accuracy: {test_top5_acc:.4f} ({test_top5_acc * 100:.2f}%)')
 
-# Save model
-model.save('models/model.keras')
+# Save model. Under mixed precision the layers carry a bfloat16 compute
+# policy that would follow the model into app.py. The variables are float32
+# already, so the served model is the same config (same layer names, which
+# model_registry looks up) with float32 policies and the trained weights.
+def float32_config(config):
+    if isinstance(config, dict):
+        if config.get('class_name') == 'DTypePolicy':
+            return 'float32'
+        return {key: float32_config(value) for key, value in config.items()}
+    if isinstance(config, list):
+        return [float32_config(value) for value in config]
+    return config
+
+
+if mixed_precision:
+    export_model = tf.keras.Sequential.from_config(float32_config(model.get_config()))
+    export_model.set_weights(model.get_weights())
+else:
+    export_model = model
+export_model.save('models/model.keras')
 print('\nModel saved as models/model.keras')
 
 # Extract training history
@@ -269,14 +311,10 @@ plt.show()
 # ============================================
 print('\n=== Generating Confusion Matrix ===')
 
-# Reset test generator
-test_generator.reset()
-
 # Get predictions
-predictions = model.predict(test_generator, steps=len(test_generator), verbose=1)
+predictions = model.predict(test_data, verbose=1)
 predicted_classes = np.argmax(predictions, axis=1)
-true_classes = test_generator.classes
-class_labels = list(test_generator.class_indices.keys())
+true_classes = np.asarray(test_classes)
 
 # Compute confusion matrix
 cm = confusion_matrix(true_classes, predicted_classes)
@@ -400,6 +438,9 @@ stats = {
     'Number of Classes': num_classes,
     'Image Size': f'{img_width}x{img_height}',
     'Batch Size': batch_size,
+    'Input Pipeline': args.pipeline,
+    'Training Mode': training_mode,
+    **epoch_times,
     'Total Parameters': model.count_params()
 }
 
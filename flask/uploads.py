@@ -0,0 +1,133 @@
+import hashlib
+import io
+import os
+import threading
+from collections import namedtuple
+
+MAX_FILE_BYTES = int(os.environ.get('SIGNATURE_MAX_FILE_BYTES', 10 * 1024 * 1024))
+MAX_REQUEST_BYTES = int(os.environ.get('SIGNATURE_MAX_REQUEST_BYTES', 64 * 1024 * 1024))
+CHUNK_SIZE = 64 * 1024
+
+ALLOWED_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+MAGIC_BYTES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+)
+SNIFF_BYTES = max(len(magic) for magic, _ in MAGIC_BYTES)
+
+# stream is positioned at the start, ready for the decoder; key matches
+# cache.content_key() of the same bytes.
+Upload = namedtuple('Upload', ['filename', 'stream', 'key', 'size', 'kind'])
+
+
+class UploadError(ValueError):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+def sniff_type(head):
+    for magic, kind in MAGIC_BYTES:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def _too_large(filename, max_bytes):
+    return UploadError(
+        "file_too_large",
+        f"{filename} is larger than the {max_bytes // (1024 * 1024)} MB limit per signature image."
+    )
+
+
+def read_upload(file, max_bytes=MAX_FILE_BYTES):
+    filename = file.filename or 'upload'
+    if not filename.lower().endswith(ALLOWED_EXTENSIONS):
+        raise UploadError("invalid_file_type", "Please ensure all uploaded files are valid signature images (PNG, JPG, JPEG).")
+
+    stream = file.stream
+
+    # Werkzeug spools large parts to a temporary file, so the size is known
+    # without reading anything and oversized files are rejected up front.
+    if stream.seekable():
+        stream.seek(0, os.SEEK_END)
+        if stream.tell() > max_bytes:
+            raise _too_large(filename, max_bytes)
+        stream.seek(0)
+
+    head = stream.read(SNIFF_BYTES)
+    kind = sniff_type(head)
+    if kind is None:
+        raise UploadError("invalid_file_type", f"{filename} is not a PNG or JPEG image.")
+
+    # Hash in chunks rather than reading the file into one bytes object; the
+    # decoder later reads the same stream, and a cache hit skips it entirely.
+    digest = hashlib.sha256(head)
+    size = len(head)
+    copy = None if stream.seekable() else io.BytesIO(head)
+
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise _too_large(filename, max_bytes)
+        digest.update(chunk)
+        if copy is not None:
+            copy.write(chunk)
+
+    if copy is not None:
+        stream = copy
+    stream.seek(0)
+
+    return Upload(filename, stream, digest.hexdigest(), size, kind)
+
+
+class UploadMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._files = 0
+        self._bytes = 0
+        self._max_request_bytes = 0
+        self._rejected = {}
+
+    def record(self, uploads):
+        request_bytes = sum(upload.size for upload in uploads)
+        with self._lock:
+            self._requests += 1
+            self._files += len(uploads)
+            self._bytes += request_bytes
+            self._max_request_bytes = max(self._max_request_bytes, request_bytes)
+
+    def reject(self, code):
+        with self._lock:
+            self._rejected[code] = self._rejected.get(code, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "files": self._files,
+                "bytes": self._bytes,
+                "averageRequestBytes": round(self._bytes / self._requests) if self._requests else 0,
+                "maxRequestBytes": self._max_request_bytes,
+                "maxFileBytes": MAX_FILE_BYTES,
+                "maxRequestBytesAllowed": MAX_REQUEST_BYTES,
+                "rejected": dict(self._rejected),
+            }
+
+
+upload_metrics = UploadMetrics()
+
+
+def read_uploads(files, max_bytes=MAX_FILE_BYTES):
+    try:
+        uploads = [read_upload(file, max_bytes) for file in files]
+    except UploadError as e:
+        upload_metrics.reject(e.code)
+        raise
+
+    upload_metrics.record(uploads)
+    return uploads